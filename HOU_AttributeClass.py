@@ -1,8 +1,16 @@
-class Attribute:
+# Attribute class of hgeo, kept in its own file. hgeo re-exports it.
+import numpy
+from hgeobase import listToDict, _Assert, _STORAGE, _rawPageDataToTupleArray, \
+                     _tupleArrayToRawPageData
+
+class Attribute(object):
     '''
         An attribute may be bound to point, primitive, vertex or detail
         elements.  The attribute stores an array of values, one for each
-        element in the detail.
+        element in the detail.  Numeric and string attributes keep them in
+        a numpy array shaped (elements, TupleSize), typed from Storage.  When
+        loaded lazily the value block is kept as parsed and only decoded the
+        first time Array is used.
     '''
     def __init__(self, name, attrib_type, attrib_scope):
         ''' Initialize an attribute of the given name, type and scope '''
@@ -13,90 +21,189 @@ class Attribute:
         self.Options = {}
         # Data defined in per-attribute value block
         self.TupleSize = 1
+        self.Storage = None
+        self._pending = None    # (value block, element count) not yet decoded
         self.Array = []
         self.Defaults = None
         self.Strings = None
 
+    def dtype(self):
+        ''' The numpy type of the attribute's Storage '''
+        default = numpy.int32 if self.Type == 'string' else numpy.float64
+        return _STORAGE.get(self.Storage, default)
+
+    def _getArray(self):
+        if self._pending is not None:
+            values, element_count = self._pending
+            self._pending = None
+            self.Array = self.loadArray(values, element_count)
+        return self._array
+
+    def _setArray(self, array):
+        ''' Numeric and string values are converted to an (N, TupleSize) array
+            of the storage type '''
+        self._pending = None
+        if self.Type in ('numeric', 'string') and array is not None:
+            array = numpy.asarray(array, dtype=self.dtype())
+            if array.ndim == 1:
+                array = array.reshape(-1, self.TupleSize)
+        self._array = array
+
+    Array = property(_getArray, _setArray)
+
+    def elementCount(self):
+        ''' Return the number of elements, without decoding a lazy array '''
+        if self._pending is not None:
+            return self._pending[1]
+        return len(self._array)
+
     def loadDefaults(self, obj):
         ''' Load defaults from the JSON schema '''
         obj = listToDict(obj)
         self.Defaults = None
         if obj:
             self.Defaults = obj.get('values', None)
+            if isinstance(self.Defaults, numpy.ndarray):
+                # binary files give number lists as arrays
+                self.Defaults = self.Defaults.tolist()
 
     def getValue(self, offset):
         ''' Implemented for numeric/string attributes.
             Return's the value for the element offset '''
         if self.Type == "numeric":
+            if self.TupleSize == 1:
+                return self.Array[offset, 0]
             return self.Array[offset]
         elif self.Type == "string":
-            str_idx = self.Array[offset]
+            str_idx = self.Array[offset, 0]
             if str_idx < 0 or str_idx >= len(self.Strings):
                 return ''
             return self.Strings[str_idx]
         return None
 
-    def loadValues(self, obj, element_count):
-        ''' Interpret the JSON schema to load numeric/string attributes '''
+    def getValues(self, indices):
+        ''' Implemented for numeric/string attributes.
+            Return's the values for an array of element offsets, as an
+            (len(indices), TupleSize) array, or an array of strings '''
+        if self.Type == "numeric":
+            return self.Array[indices]
+        elif self.Type == "string":
+            strings = numpy.array(list(self.Strings) + [''], dtype=object)
+            str_idx = self.Array[indices, 0]
+            missing = (str_idx < 0) | (str_idx >= len(self.Strings))
+            return strings[numpy.where(missing, len(self.Strings), str_idx)]
+        return None
+
+    def loadPages(self, values, element_count):
+        ''' Decode paged data (rawpagedata), or return None if there is none '''
+        pagedata = values.get('rawpagedata', None)
+        if pagedata is None:
+            return None
+        packing = values.get('packing', [self.TupleSize])
+        pagesize = values.get('pagesize', -1)
+        _Assert(pagesize >= 0, "Expected pagesize field")
+        constflags = values.get('constantpageflags', None)
+        array = _rawPageDataToTupleArray(raw=pagedata,
+                                         packing=packing,
+                                         pagesize=pagesize,
+                                         constflags=constflags,
+                                         total_tuples=element_count)
+        return array
+
+    def loadArray(self, values, element_count):
+        ''' Decode a values (or string indices) block into an array '''
+        array = values.get('tuples', None)
+        if array is None:
+            array = self.loadPages(values, element_count)
+        if array is None:
+            array = values.get('arrays', None)
+            _Assert(array and self.TupleSize == 1, "Expected a single value")
+            # Stored as a tuple of arrays rather than an array of tuples,
+            # so de-reference the index, giving the expected result.
+            array = array[0]
+        return array
+
+    def loadValues(self, obj, element_count, lazy=False):
+        ''' Interpret the JSON schema to load numeric/string attributes.  With
+            lazy the values are decoded on first use of Array. '''
         obj = listToDict(obj)
         self.loadDefaults(obj.get('defaults', None))
         if self.Type == 'numeric':
             values = listToDict(obj['values'])
-            self.TupleSize = values.get('size', 1)
-            self.Array = values.get('tuples', None)
             self.Storage = values.get('storage', 'fpreal32')
-            if not self.Array:
-                pagedata = values.get('rawpagedata', None)
-                if pagedata is not None:
-                    packing = values.get('packing', [self.TupleSize])
-                    pagesize = values.get('pagesize', -1)
-                    _Assert(pagesize >= 0, "Expected pagesize field")
-                    constflags = values.get('constantpageflags', None)
-                    self.Array = _rawPageDataToTupleArray(
-                                                raw=pagedata,
-                                                packing=packing,
-                                                pagesize=pagesize,
-                                                constflags=constflags,
-                                                total_tuples=element_count)
-            if not self.Array:
-                self.Array = values.get('arrays', None)
-                _Assert(self.Array and self.TupleSize == 1,
-                        "Expected a single value")
-                # Stored as a tuple of arrays rather than an array of tuples,
-                # so de-reference the index, giving the expected result.
-                self.Array = self.Array[0]
         elif self.Type == 'string':
             self.Strings = obj['strings']
-            indices = listToDict(obj['indices'])
-            self.TupleSize = indices.get('size', 1)
-            self.Array = indices.get('tuples', None)
-            self.Storage = indices.get('storage', 'int32')
-            if not self.Array:
-                pagedata = indices.get('rawpagedata', None)
-                if pagedata is not None:
-                    packing = indices.get('packing', [self.TupleSize])
-                    pagesize = indices.get('pagesize', -1)
-                    _Assert(pagesize >= 0, "Expected pagesize field")
-                    constflags = indices.get('constantpageflags', None)
-                    self.Array = _rawPageDataToTupleArray(
-                                                raw=pagedata,
-                                                packing=packing,
-                                                pagesize=pagesize,
-                                                constflags=constflags,
-                                                total_tuples=element_count)
-            if not self.Array:
-                self.Array = indices.get('arrays', None)
-                _Assert(self.Array and self.TupleSize == 1,
-                        "Expected a single value")
-                self.Array = self.Array[0]
+            values = listToDict(obj['indices'])
+            self.Storage = values.get('storage', 'int32')
         else:
             # Unknown attribute type, so just store the entire attribute value
             # block
             print 'Unknown attribute type', self.Type
             self.Array = obj
+            return
+        self.TupleSize = values.get('size', 1)
+        if lazy:
+            self._pending = (values, element_count)
+        else:
+            self.Array = self.loadArray(values, element_count)
+
+    def streamBlock(self, tokens, element_count, storage):
+        ''' Read a values (or string indices) block from a geostream.JSONTokens
+            reader, decoding the value lists straight into numpy arrays of the
+            block's storage type, sized from the element count. '''
+        block = {}
+        tokens.enter()
+        while tokens.more():
+            key = tokens.value()
+            size = block.get('size', 1)
+            dtype = _STORAGE.get(block.get('storage', storage), numpy.float64)
+            if key == 'tuples':
+                out = numpy.empty((element_count, size), dtype)
+                block[key] = tokens.numbers(dtype, out).reshape(-1, size)
+            elif key == 'arrays':
+                out = numpy.empty(element_count * size, dtype)
+                block[key] = [ tokens.numbers(dtype, out) ]
+            elif key == 'rawpagedata':
+                out = numpy.empty(element_count * size, dtype)
+                block[key] = tokens.numbers(dtype, out)
+            else:
+                block[key] = tokens.value()
+        return block
+
+    def streamValues(self, tokens, element_count):
+        ''' Load the attribute's value block from a geostream.JSONTokens reader,
+            without building Python lists for the values '''
+        obj = {}
+        tokens.enter()
+        while tokens.more():
+            key = tokens.value()
+            if key == 'values' and self.Type == 'numeric':
+                obj[key] = self.streamBlock(tokens, element_count, 'fpreal32')
+            elif key == 'indices' and self.Type == 'string':
+                obj[key] = self.streamBlock(tokens, element_count, 'int32')
+            else:
+                obj[key] = tokens.value()
+        self.loadValues(obj, element_count)
+
+    def savePages(self, storage, pagesize):
+        ''' Create the paged (rawpagedata) schema for the attribute's values '''
+        packing = [self.TupleSize]
+        raw, constflags = _tupleArrayToRawPageData(self.Array, packing, pagesize)
+        block = [
+            "size", self.TupleSize,
+            "storage", storage,
+            "packing", packing,
+            "pagesize", pagesize,
+        ]
+        if constflags is not None:
+            block += [ "constantpageflags", constflags ]
+        block += [ "rawpagedata", raw ]
+        return block
 
-    def save(self):
-        ''' Create the JSON schema from the attribute's data '''
+    def save(self, pagesize=None):
+        ''' Create the JSON schema from the attribute's data.  With a pagesize,
+            numeric and string values are written as paged data, storing
+            subvectors which are constant over a page only once. '''
         adef = [
             "scope", self.Scope,
             "type", self.Type,
@@ -119,25 +226,32 @@ class Attribute:
 
         kword = "tuples"
         a = self.Array
-        if self.TupleSize == 1:
+        if self.TupleSize == 1 and self.Type in ('numeric', 'string'):
             kword = "arrays"    # Store tuple of arrays not an array of tuples
-            a = [self.Array]
+            a = [self.Array[:, 0]]
+        paged = pagesize and len(self.Array) and self.Type in ('numeric', 'string')
         if self.Type == 'numeric':
             avalue += [ 'storage', self.Storage ]
-            avalue += [
-                "values", [
-                    "size", self.TupleSize,
-                    "storage", self.Storage,
-                    kword, self.Array
+            if paged:
+                avalue += [ "values", self.savePages(self.Storage, pagesize) ]
+            else:
+                avalue += [
+                    "values", [
+                        "size", self.TupleSize,
+                        "storage", self.Storage,
+                        kword, a
+                    ]
                 ]
-            ]
         elif self.Type == 'string':
-            avalue += [
-                "indices", [
-                    "size", self.TupleSize,
-                    "storage", "int32",
-                    kword, self.Array ]
-            ]
+            if paged:
+                avalue += [ "indices", self.savePages("int32", pagesize) ]
+            else:
+                avalue += [
+                    "indices", [
+                        "size", self.TupleSize,
+                        "storage", "int32",
+                        kword, a ]
+                ]
         else:
             avalue += self.Array
         return [ adef, avalue ]
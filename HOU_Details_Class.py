@@ -1,4 +1,43 @@
-class Detail:
+# Detail class of hgeo. Its helpers and primitives come from hgeobase, not hgeo,
+# which imports this file.
+from hgeobase import listToDict, _Assert, _Verbose, _VERSION, json, bjson, readJSON, \
+                     ElementGroup, TrimRegion, PolyRun, primRun, primLoaders, loadUnknown
+from HOU_AttributeClass import Attribute
+import geostream
+import numpy
+
+# attribute dictionaries of the schema, their Detail member and element count
+_ATTRIBUTE_DICTS = {
+    'vertexattributes' : ('VertexAttributes', 'vertexcount'),
+    'pointattributes' : ('PointAttributes', 'pointcount'),
+    'primitiveattributes' : ('PrimitiveAttributes', 'primitivecount'),
+    'globalattributes' : ('GlobalAttributes', None),
+}
+_GROUP_DICTS = {
+    'vertexgroups' : ('VertexGroups', 'vertexcount'),
+    'pointgroups' : ('PointGroups', 'pointcount'),
+    'primitivegroups' : ('PrimitiveGroups', 'primitivecount'),
+}
+
+def _primCount(block):
+    ''' The number of primitives in an entry of Detail.Primitives '''
+    if isinstance(block, PolyRun):
+        return len(block)
+    return 1
+
+def _primAt(block, index):
+    ''' The index'th primitive of an entry of Detail.Primitives '''
+    if isinstance(block, PolyRun):
+        return block[index]
+    return block
+
+def _streamList(tokens):
+    ''' Parse the elements of the list starting here one at a time '''
+    tokens.enter()
+    while tokens.more():
+        yield tokens.value()
+
+class Detail(object):
     '''
         A detail object contains:
             - Point Attributes
@@ -6,8 +45,11 @@ class Detail:
             - Primitive Attributes
             - Global/Detail Attributes
             - VertexMap (which points are referenced by which vertices)
-            - A list of primitives
+            - A list of primitives, where a run of polygons is a single
+              PolyRun entry holding all of them
             - Group information
+        Loaded lazily, attribute values, group selections and the primitives
+        are kept as parsed until they are first used.
     '''
     def __init__(self):
         ''' Initialize an empty detail '''
@@ -16,19 +58,87 @@ class Detail:
         self.VertexAttributes = {}
         self.GlobalAttributes = {}
         self.VertexMap = []
+        self._primData = None   # (parsed primitive blocks, count) not yet loaded
         self.Primitives = []
+        self.PointGroups = {}
+        self.VertexGroups = {}
+        self.PrimitiveGroups = {}
         self.Info = None
 
+    def _getPrimitives(self):
+        if self._primData is not None:
+            data = self._primData[0]
+            self._primData = None
+            self._primitives = []
+            self.loadPrimitives(data)
+        return self._primitives
+
+    def _setPrimitives(self, primitives):
+        self._primData = None
+        self._primitives = primitives
+
+    Primitives = property(_getPrimitives, _setPrimitives)
+
     def pointCount(self):
         ''' Return the number of points '''
         P = self.PointAttributes['P']
-        return len(P.Array)
+        return P.elementCount()
     def vertexCount(self):
         ''' Return the total number of vertices '''
         return len(self.VertexMap)
     def primitiveCount(self):
         ''' Return the number of primitives '''
-        return len(self.Primitives)
+        if self._primData is not None:
+            return self._primData[1]
+        return sum(_primCount(p) for p in self.Primitives)
+
+    def primitiveTypes(self):
+        ''' Return the number of primitives of each type, without loading
+            deferred primitives '''
+        counts = {}
+        if self._primData is None:
+            for p in self.Primitives:
+                counts[p.Type] = counts.get(p.Type, 0) + _primCount(p)
+            return counts
+        for pdef, pdata in self._primData[0]:
+            pdef = listToDict(pdef)
+            if pdef['type'] == 'run':
+                ptype = pdef['runtype']
+                counts[ptype] = counts.get(ptype, 0) + len(pdata)
+            else:
+                counts[pdef['type']] = counts.get(pdef['type'], 0) + 1
+        return counts
+
+    def iterPrimitives(self):
+        ''' Iterate over the primitives one by one, runs included '''
+        for p in self.Primitives:
+            if isinstance(p, PolyRun):
+                for prim in p:
+                    yield prim
+            else:
+                yield p
+
+    def getPrimitive(self, prim_num):
+        ''' Return a single primitive.  If the primitives are deferred, only
+            the block holding it is loaded. '''
+        if self._primData is None:
+            for p in self.Primitives:
+                if prim_num < _primCount(p):
+                    return _primAt(p, prim_num)
+                prim_num -= _primCount(p)
+            raise IndexError('primitive index out of range')
+        for pdef, pdata in self._primData[0]:
+            pdef = listToDict(pdef)
+            if pdef['type'] == 'run':
+                if prim_num < len(pdata):
+                    block = self.loadPrimitiveBlock(pdef, [pdata[prim_num]])[0]
+                    return _primAt(block, 0)
+                prim_num -= len(pdata)
+            elif prim_num == 0:
+                return self.loadPrimitiveBlock(pdef, pdata)[0]
+            else:
+                prim_num -= 1
+        raise IndexError('primitive index out of range')
 
     def vertexPoint(self, vertex_offset):
         ''' Return the point offset for the given vertex offset.  That is, the
@@ -42,10 +152,10 @@ class Detail:
         pointref = listToDict(obj.get('pointref', None))
         _Assert(pointref, "Missing 'pointref' for topology")
         self.VertexMap = pointref.get('indices', None)
-        _Assert(self.VertexMap and type(self.VertexMap) == list,
-                "Invalid vertex topology")
+        # a points only file (a point cloud) has no vertices
+        _Assert(isinstance(self.VertexMap, (list, numpy.ndarray)), "Invalid vertex topology")
 
-    def loadSingleAttribute(self, attrib_data, element_count):
+    def loadSingleAttribute(self, attrib_data, element_count, lazy=False):
         ''' Interpret the schema for an attribute and create the attribute.
             Attributes are stored in a list of 2 objects.  The first object is
             the attribute definition, the second is the attribute's data.'''
@@ -54,34 +164,35 @@ class Detail:
         adef = listToDict(attrib_data[0])
         attrib = Attribute(adef['name'], adef['type'], adef['scope'])
         attrib.Options = adef.get('options', {})
-        attrib.loadValues(attrib_data[1], element_count)
+        attrib.loadValues(attrib_data[1], element_count, lazy)
         return attrib
 
-    def loadAttributeDict(self, attrib_list, element_count):
+    def loadAttributeDict(self, attrib_list, element_count, lazy=False):
         ''' Interpret the schema for a dictionary of attributes.  That is, all
             the attributes for a given element type (point, vertex, etc.) '''
         if not attrib_list:
             return {}
         attributes = {}
         for attrib in attrib_list:
-            a = self.loadSingleAttribute(attrib, element_count)
+            a = self.loadSingleAttribute(attrib, element_count, lazy)
             if a:
                 attributes[a.Name] = a
         return attributes
 
-    def loadAttributes(self, obj, pointcount, vertexcount, primitivecount):
+    def loadAttributes(self, obj, pointcount, vertexcount, primitivecount,
+                       lazy=False):
         ''' Interpret the schema to load all attributes '''
         obj = listToDict(obj)
         self.VertexAttributes = self.loadAttributeDict(
-                        obj.get('vertexattributes', None), vertexcount)
+                        obj.get('vertexattributes', None), vertexcount, lazy)
         self.PointAttributes = self.loadAttributeDict(
-                        obj.get('pointattributes', None), pointcount)
+                        obj.get('pointattributes', None), pointcount, lazy)
         self.PrimitiveAttributes = self.loadAttributeDict(
-                        obj.get('primitiveattributes', None), primitivecount)
+                        obj.get('primitiveattributes', None), primitivecount, lazy)
         self.GlobalAttributes = self.loadAttributeDict(
-                        obj.get('globalattributes', None), 1)
+                        obj.get('globalattributes', None), 1, lazy)
 
-    def loadElementGroup(self, obj, element_count):
+    def loadElementGroup(self, obj, element_count, lazy=False):
         ''' Interpret the schema to load all element groups for a given type '''
         glist = {}
         nload = 0
@@ -90,50 +201,62 @@ class Detail:
                 gdef = listToDict(g[0])
                 gname = gdef['name']
                 glist[gname] = ElementGroup(gname)
-                glist[gname].loadSelection(g[1], element_count)
+                glist[gname].loadSelection(g[1], element_count, lazy)
                 nload += 1
                 if nload % 100 == 0:
                     _Verbose('Loaded %d groups' % nload)
         return glist
 
-    def loadElementGroups(self, obj):
+    def loadElementGroups(self, obj, lazy=False):
         ''' Load all vertex, point and primitive groups '''
         self.VertexGroups = self.loadElementGroup(
-                        obj.get('vertexgroups', None), self.vertexCount())
+                        obj.get('vertexgroups', None), self.vertexCount(), lazy)
         self.PointGroups = self.loadElementGroup(
-                        obj.get('pointgroups', None), self.pointCount())
+                        obj.get('pointgroups', None), self.pointCount(), lazy)
         self.PrimitiveGroups = self.loadElementGroup(
-                        obj.get('primitivegroups', None), self.primitiveCount())
+                        obj.get('primitivegroups', None), self.primitiveCount(), lazy)
 
-    def loadSinglePrimitive(self, pdef, pdata):
-        ''' Load a single primitive by finding a function to interpret the
-            schema for the type.  If there's no known schema, we just hold onto
-            the data block so it can be saved (see loadUnknown)'''
-        pdef = listToDict(pdef)
+    def loadPrimitiveBlock(self, pdef, pdata):
+        ''' Return the primitives of a single block, a run or one primitive,
+            by finding a function to interpret the schema for the type.  If
+            there's no known schema, we just hold onto the data block so it can
+            be saved (see loadUnknown)'''
         ptype = pdef['type']
         if ptype == 'run':
-            self.Primitives += primRun(pdef, pdata)
-        else:
-            self.Primitives.append(primLoaders.get(ptype, loadUnknown)(ptype, pdata))
+            return primRun(pdef, pdata)
+        return [ primLoaders.get(ptype, loadUnknown)(ptype, pdata) ]
+
+    def loadSinglePrimitive(self, pdef, pdata):
+        ''' Load a single primitive (or a run of them) '''
+        self.Primitives += self.loadPrimitiveBlock(listToDict(pdef), pdata)
 
     def loadPrimitives(self, obj):
         ''' Load all primitives from the schema '''
         for p in obj:
             self.loadSinglePrimitive(p[0], p[1])
 
-    def loadJSON(self, file):
-        ''' Interpret the JSON object schema to create a Detail object '''
+    def loadJSON(self, file, lazy=False):
+        ''' Interpret the JSON object schema to create a Detail object.  file
+            may also be an open .geo or .bgeo file.  With lazy, attribute
+            values, group selections and primitives are only decoded when they
+            are first used, so asking for counts or a single attribute is cheap.'''
+        if hasattr(file, 'read'):
+            file = readJSON(file)
         file = listToDict(file)
         self.Info = file.get('info', None)
         self.loadTopology(file['topology'])
         _Verbose('Loaded Topology')
         self.loadAttributes(file['attributes'], pointcount=file['pointcount'],
                             vertexcount=file['vertexcount'],
-                            primitivecount=file['primitivecount'])
+                            primitivecount=file['primitivecount'],
+                            lazy=lazy)
         _Verbose('Loaded Attributes')
-        self.loadPrimitives(file['primitives'])
-        _Verbose('Loaded Primitives')
-        self.loadElementGroups(file)
+        if lazy:
+            self._primData = (file['primitives'], file['primitivecount'])
+        else:
+            self.loadPrimitives(file['primitives'])
+            _Verbose('Loaded Primitives')
+        self.loadElementGroups(file, lazy)
         _Verbose('Loaded Groups')
 
         # Trim regions for profile curves
@@ -146,25 +269,136 @@ class Detail:
                 region.load(t)
                 self.TrimRegions.append(region)
 
-    def saveAttributes(self, name, adict):
+    def streamTopology(self, tokens, vertexcount):
+        ''' Read the topology, decoding the vertex map into an array '''
+        tokens.enter()
+        while tokens.more():
+            if tokens.value() != 'pointref':
+                tokens.skip()
+                continue
+            tokens.enter()
+            while tokens.more():
+                if tokens.value() == 'indices':
+                    out = numpy.empty(vertexcount, dtype=numpy.int32)
+                    self.VertexMap = tokens.numbers(numpy.int32, out)
+                else:
+                    tokens.skip()
+        _Assert(len(self.VertexMap) == vertexcount, "Invalid vertex topology")
+
+    def streamAttributes(self, tokens, counts):
+        ''' Read all the attribute dictionaries, one attribute at a time '''
+        tokens.enter()
+        while tokens.more():
+            key = tokens.value()
+            if key not in _ATTRIBUTE_DICTS:
+                tokens.skip()
+                continue
+            member, countkey = _ATTRIBUTE_DICTS[key]
+            element_count = counts[countkey] if countkey else 1
+            attributes = {}
+            tokens.enter()
+            while tokens.more():
+                tokens.enter()
+                adef = listToDict(tokens.value())
+                attrib = Attribute(adef['name'], adef['type'], adef['scope'])
+                attrib.Options = adef.get('options', {})
+                attrib.streamValues(tokens, element_count)
+                _Assert(not tokens.more(), 'Invalid attribute defintion block')
+                attributes[attrib.Name] = attrib
+            setattr(self, member, attributes)
+
+    def streamPrimitives(self, tokens, counts):
+        ''' Read the primitive blocks one at a time.  A run of polygons varying
+            only in their vertices (what a tree export writes) has its vertex
+            lists decoded straight into the arrays of a PolyRun, sized from the
+            vertex and primitive counts; other blocks are parsed and loaded as
+            they come. '''
+        self.Primitives = []
+        vertices = counts['vertexcount']
+        tokens.enter()
+        while tokens.more():
+            tokens.enter()
+            pdef = listToDict(tokens.value())
+            if pdef['type'] == 'run' and pdef['runtype'] == 'Poly' and \
+                    list(pdef['varyingfields']) == [ 'vertex' ]:
+                out = numpy.empty(vertices, dtype=numpy.int32)
+                indices, sizes = tokens.numberLists(numpy.int32, 3, out)
+                if len(indices) < len(out):
+                    indices = indices.copy()
+                vertices -= len(indices)
+                offsets = numpy.concatenate(([0], numpy.cumsum(sizes)))
+                closed = pdef['uniformfields'].get('closed', True)
+                self.Primitives.append(PolyRun(indices, offsets, closed))
+            else:
+                self.Primitives += self.loadPrimitiveBlock(pdef, tokens.value())
+            _Assert(not tokens.more(), 'Invalid primitive block')
+
+    def loadStream(self, fp):
+        ''' Load an ASCII .geo file while reading it, rather than parsing it
+            into one JSON object first.  Attribute values and the vertex map
+            are decoded straight into numpy arrays sized from the element
+            counts, as are the vertex lists of polygon runs (streamPrimitives).
+            Other primitives and groups are interpreted as soon as they are
+            parsed, so memory stays close to the size of the result.'''
+        tokens = geostream.JSONTokens(fp)
+        counts = {}
+        tokens.enter()
+        while tokens.more():
+            key = tokens.value()
+            if key in ('pointcount', 'vertexcount', 'primitivecount'):
+                counts[key] = tokens.value()
+            elif key == 'info':
+                self.Info = tokens.value()
+            elif key == 'topology':
+                self.streamTopology(tokens, counts['vertexcount'])
+                _Verbose('Loaded Topology')
+            elif key == 'attributes':
+                self.streamAttributes(tokens, counts)
+                _Verbose('Loaded Attributes')
+            elif key == 'primitives':
+                self.streamPrimitives(tokens, counts)
+                _Verbose('Loaded Primitives')
+            elif key in _GROUP_DICTS:
+                member, countkey = _GROUP_DICTS[key]
+                setattr(self, member, self.loadElementGroup(
+                                _streamList(tokens), counts[countkey]))
+            elif key == 'altitude':
+                self.Altitude = tokens.value()
+            elif key == 'trimregions':
+                self.TrimRegions = []
+                for t in _streamList(tokens):
+                    region = TrimRegion()
+                    region.load(t)
+                    self.TrimRegions.append(region)
+            else:
+                tokens.skip()
+        _Verbose('Loaded Groups')
+
+    def saveAttributes(self, name, adict, lazy=False, pagesize=None):
         ''' Create the JSON schema for an attribute dictionary '''
         if not adict:
             return []
+        if lazy:
+            return [ name, (adict[a].save(pagesize) for a in adict) ]
         attribs = []
         for a in adict:
-            attribs += [adict[a].save()]
+            attribs += [adict[a].save(pagesize)]
         return [ name, attribs ]
 
-    def savePrimitives(self):
+    def savePrimitives(self, lazy=False):
         ''' Create the JSON schema for all the primitives '''
+        if lazy:
+            return [ "primitives", (p.save() for p in self.Primitives) ]
         prims = []
         for p in self.Primitives:
             prims.append(p.save())
         return [ "primitives", prims ]
 
-    def saveGroups(self, glabel, gtype, glist):
+    def saveGroups(self, glabel, gtype, glist, lazy=False):
         ''' Create the JSON schema for the element groups for a single element
             type.'''
+        if glist and lazy:
+            return [ glabel, (glist[gname].save(gtype) for gname in glist) ]
         if glist:
             groups = []
             for gname in glist:
@@ -175,11 +409,15 @@ class Detail:
 
     #------------------------------------WRITE OUT ---------------------------------------
 
-    def saveJSON(self):
+    def saveJSON(self, lazy=False, pagesize=None):
         ''' Create the JSON schema for the detail:  all the attributes,
             primitives, groups.
             For 2D (trim curves), the detail also contains special properties
-            for the altitude and trim regions.'''
+            for the altitude and trim regions.
+            With lazy, each attribute, primitive and group block is a generator
+            which builds its schema only when it is written (see geostream).
+            With a pagesize, vertex, point and primitive attribute values are
+            written as paged data (see Attribute.save).'''
         data = []
         data += [ 'fileversion', _VERSION ]
         data += [ 'pointcount', self.pointCount() ]
@@ -187,16 +425,16 @@ class Detail:
         data += [ 'primitivecount', self.primitiveCount() ]
         data += [ 'topology', [ 'pointref', [ 'indices', self.VertexMap ] ] ]
         attribs = []
-        attribs += self.saveAttributes('vertexattributes', self.VertexAttributes)
-        attribs += self.saveAttributes('pointattributes', self.PointAttributes)
-        attribs += self.saveAttributes('primitiveattributes', self.PrimitiveAttributes)
-        attribs += self.saveAttributes('globalattributes', self.GlobalAttributes)
+        attribs += self.saveAttributes('vertexattributes', self.VertexAttributes, lazy, pagesize)
+        attribs += self.saveAttributes('pointattributes', self.PointAttributes, lazy, pagesize)
+        attribs += self.saveAttributes('primitiveattributes', self.PrimitiveAttributes, lazy, pagesize)
+        attribs += self.saveAttributes('globalattributes', self.GlobalAttributes, lazy)
         if attribs:
             data += ["attributes", attribs]
-        data += self.savePrimitives()
-        data += self.saveGroups("pointgroups", "point", self.PointGroups)
-        data += self.saveGroups("vertexgroups", "vertex", self.VertexGroups)
-        data += self.saveGroups("primitivegroups", "primitive", self.PrimitiveGroups)
+        data += self.savePrimitives(lazy)
+        data += self.saveGroups("pointgroups", "point", self.PointGroups, lazy)
+        data += self.saveGroups("vertexgroups", "vertex", self.VertexGroups, lazy)
+        data += self.saveGroups("primitivegroups", "primitive", self.PrimitiveGroups, lazy)
         if hasattr(self, 'Altitude'):
             data += ["altitude", self.Altitude]
         if hasattr(self, 'TrimRegions'):
@@ -206,8 +444,17 @@ class Detail:
             data += ["trimregions", regions]
         return data
 
-    def save(self, fp, indent=None):
-        ''' Save the JSON schema to a file '''
-        hjson.dump(self.saveJSON(), fp, indent=indent)
+    def save(self, fp, indent=None, binary=False, pagesize=None):
+        ''' Save the JSON schema to a file.  Without indent it is streamed out
+            block by block, in chunks, rather than built whole first.  With
+            binary it is written as binary JSON (.bgeo), fp must be opened 'wb'.
+            pagesize writes attributes as paged data, hgeo.PAGESIZE is Houdini's. '''
+        if binary:
+            bjson.dump(self.saveJSON(lazy=True, pagesize=pagesize), fp)
+        elif indent is None:
+            geostream.writeJSON(fp, self.saveJSON(lazy=True, pagesize=pagesize))
+        else:
+            json.dump(self.saveJSON(pagesize=pagesize), fp, indent=indent,
+                      default=geostream._plain)
 
 
@@ -3,6 +3,7 @@
 import cPickle as pickle
 import shelve
 import os
+import treeio
 
 #+++++++++++++++++++++++++++++++ATTRIBUTE CLASS  ++++++++++++++++++++++++++++++++++++
 #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++ 
@@ -68,7 +69,6 @@ class ToGeo(object):
                     continue
                 if start == 1:
                     name = val[0] #this will be a string
-                    self.
                     tmpList.append(val[0])
                     
                 #print val[0]
@@ -79,14 +79,19 @@ class ToGeo(object):
         
 
 
-    def loadFile(self, filename):
-        """loads a pickled data file generated by runTree.py """
+    def loadFile(self, filename, mmap=False, names=None):
+        """loads a tree file written by runTree.py. self.header is the file header and self.data a dict
+        of point columns, by attribute name. Old pickled files are converted to columns as they load.
+        With mmap the columns are read-only memory maps that load as they are used; names limits
+        loading to the listed attributes, e.g. ["pos", "parentId"]."""
+        if treeio.isColumnFile(filename):
+            self.header, self.data = treeio.loadColumns(filename, names=names, mmap=mmap)
+            return
         thisFile = open(filename, "rb")
-        #myFile = pickle.load(open(filename,"rb"))
         myFile = pickle.load(thisFile)
-        self.header = myFile[0]
-        self.data = myFile[1]
         thisFile.close()
+        self.header = {"attList" : myFile[0]}
+        self.data = treeio.pickleToColumns(myFile)
         
     def save(self):
         ''' Create the JSON schema from the attribute's data '''
@@ -234,6 +239,7 @@ class ToGeo(object):
                 _ginfo(f)
 #=============================TESTING============================
 
-g = ToGeo("control.txt")
-g.loadFile("saveData.p")
+if __name__ == "__main__":
+    g = ToGeo("control.txt")
+    g.loadFile("saveData.tree")
 
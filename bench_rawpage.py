@@ -0,0 +1,170 @@
+#! /usr/bin/env python2.6
+
+""" Benchmark for hgeo._rawPageDataToTupleArray on million point attributes.
+
+Packs random tuples into Houdini's paged layout (rawpagedata) for a few packings, with and
+without constant pages, decodes them with both the original per tuple implementation (kept
+below as _reference) and the vectorized one, checks they agree and prints the timings.
+
+    python bench_rawpage.py [points]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+import hgeo
+from hgeo import _Assert
+
+
+def _reference(raw, packing, pagesize, constflags, total_tuples):
+    ''' the original per tuple decoder, kept to check against '''
+    # Raw page data is stored interleaved as:
+    # [ <subvector0_page0> <subvector1_page0> <subvector2_page0>
+    #   <subvector0_page1> <subvector1_page1> <subvector2_page1>
+    #   <subvector0_page2> <subvector1_page2> <subvector2_page2>
+    #  ...
+    #   <subvector0_pageN> <subvector1_pageN> <subvector2_pageN>]
+    #
+    # <subvectorI_PageJ> will be a single subvector value if constflags[i][j]
+    # is True.
+    import operator
+    tuple_size = sum(packing)
+    n_pages = 0
+    # We can extract the number of pages from the length of a constant flag
+    # table if any subvectors have one.
+    if constflags is not None:
+        n_pages = reduce(lambda x,y: x if x > 0 else len(y), constflags, 0)
+    # Failing that, we know that raw contains no constant pages, and so we
+    # can compute the number of pages directly from the length of raw.
+    if n_pages == 0:
+        full_pagesize = tuple_size * pagesize
+        n_pages = (len(raw) + full_pagesize - 1) // full_pagesize
+
+    # Build list of the subvector index and offset into that subvector for
+    # each tuple component.
+    tuple_pack_info = []
+    for i in xrange(0, len(packing)):
+        tuple_pack_info.extend([(i, j) for j in xrange(0, packing[i])])
+
+    # Precompute the increments for pages where all subvectors are varying
+    # as these don't change.
+    varying_steps = [1] * len(packing)
+    varying_steps = map(operator.mul, packing, varying_steps)
+
+    result = []
+    raw_index = 0
+    raw_left = len(raw)
+    # Iterate over the input pages
+    for i in xrange(0, n_pages):
+        # Compute the packed vector steps, i.e., the step to take in raw to
+        # move to the start of the next packed subvector.  This will be 0
+        # for constant pages.
+        if constflags is not None:
+            pv_steps = [0 if (len(x) > 0 and x[i]) else 1 for x in constflags]
+            pv_steps = map(operator.mul, packing, pv_steps)
+        else:
+            pv_steps = varying_steps
+        # Compute the number of varying components on this page using the
+        # already computed vec_increments.
+        n_varying = sum(pv_steps)
+        # Use the number of varying components and the amount of data left
+        # to compute the number of tuples this page represents.  When the
+        # last page is constant for all the subvectors, i.e., there are no
+        # varying components, we load a single tuple in this iteration and
+        # later duplicate it to create the remaining tuples.
+        if n_varying > 0:
+            n_tuples = min(pagesize, (raw_left - (tuple_size - n_varying)) // n_varying)
+        else:
+            _Assert( raw_left >= tuple_size, "Expected more data" )
+            n_tuples = pagesize if raw_left > tuple_size else 1
+
+        # Compute the list of offsets into raw for the start of each packed
+        # subvector.
+        curr_offset = raw_index
+        pv_offsets = []
+        for i, step in enumerate(pv_steps):
+            pv_offsets.append(curr_offset)
+            curr_offset += max(step * n_tuples, packing[i])
+            
+        # Finally, extract each tuple on the page from the raw list.
+        if tuple_size > 1:
+            for j in xrange(0, n_tuples):
+                result.append([raw[pv_offsets[x]+y] for x,y in tuple_pack_info])
+                pv_offsets = map(operator.add, pv_offsets, pv_steps)
+        else:
+            for j in xrange(0, n_tuples):
+                result.append(raw[pv_offsets[0]])
+                pv_offsets = map(operator.add, pv_offsets, pv_steps)
+
+        consumed = n_varying * n_tuples + (tuple_size - n_varying)
+        raw_index += consumed
+        raw_left -= consumed
+        _Assert( raw_index == curr_offset, "Indexing bug" )
+
+    # The loop above marshalls all the available data in raw into our result,
+    # but without explicitly using the total_tuples argument, we had no way
+    # of computing the size of the last page if it was constant for all the
+    # subvectors.  In such a case, we treated it as if it contained a single
+    # tuple, and so we now add any missing tuples.
+    if constflags is not None and result:
+        copy_source = result[-1]
+        if tuple_size > 1:
+            for i in xrange(len(result), total_tuples):
+                result.append(list(copy_source))
+        else:
+            for i in xrange(len(result), total_tuples):
+                result.append(copy_source)
+            
+    _Assert( len(result) == total_tuples, "Expected more data" )
+    return result
+
+
+def pack(values, packing, pagesize, constpages=()):
+    """ packs an (N, tuple_size) array as rawpagedata. The pages listed in constpages are
+        written as constant (for every subvector) with the page's first tuple. Returns
+        (raw, constflags). """
+    n = len(values)
+    n_pages = (n + pagesize - 1) // pagesize
+    columns = np.cumsum([0] + list(packing))
+    raw = []
+    constflags = [[False] * n_pages for p in packing] if constpages else None
+    for i in xrange(n_pages):
+        page = values[i * pagesize:(i + 1) * pagesize]
+        for k in xrange(len(packing)):
+            sub = page[:, columns[k]:columns[k + 1]]
+            if i in constpages:
+                constflags[k][i] = True
+                page[:] = page[0]
+                raw.append(sub[0])
+            else:
+                raw.append(sub.ravel())
+    return np.concatenate(raw).tolist(), constflags
+
+
+def bench(name, n, packing, pagesize=1024, constpages=()):
+    values = np.random.random((n, sum(packing)))
+    raw, constflags = pack(values, packing, pagesize, constpages)
+    start = time.time()
+    old = _reference(raw, packing, pagesize, constflags, n)
+    told = time.time() - start
+    start = time.time()
+    new = hgeo._rawPageDataToTupleArray(raw, packing, pagesize, constflags, n)
+    tnew = time.time() - start
+    expect = new[:, 0].tolist() if sum(packing) == 1 else new.tolist()
+    assert expect == old, name
+    assert np.array_equal(new, values), name
+    print "%-28s %9d points  %8.3fs -> %7.4fs  (%5.0fx)" % (name, n, told, tnew, told / tnew)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    pages = (n + 1023) // 1024
+    bench("P [3]", n, [3])
+    bench("float [1]", n, [1])
+    bench("packed [1, 3]", n, [1, 3])
+    bench("constant pages [3]", n, [3], constpages=set(range(0, pages, 3)))
+    bench("constant pages [2, 2]", n, [2, 2], constpages=set(range(1, pages, 4)))
+    bench("constant last page [1]", n - 5, [1], constpages=set([pages - 1]))
+    bench("constant last page [3]", n - 5, [3], constpages=set([pages - 1]))
@@ -0,0 +1,451 @@
+'''
+    Binary JSON for the Houdini geometry schema (.bgeo style files).
+
+    The encoding follows the token layout of Houdini's binary JSON: a stream starts with
+    the magic token and "NSJb", and every value is a one byte token id followed by its
+    data, little-endian.  Strings are defined once as numbered tokens and referenced after
+    that, which matters for a schema that repeats the same keys for every primitive.  Lists
+    of numbers are written as uniform arrays, a type and a count followed by the raw block
+    of values, so point attributes cost 4 or 8 bytes a component instead of their text.
+
+    dump/dumps/load/loads work like their json counterparts.  Generators are written as
+    arrays, so Detail.saveJSON(lazy=True) can be streamed.  Uniform arrays are decoded back
+    to lists, so loads(dumps(obj)) == obj for anything json can hold, or to numpy arrays
+    with arrays=True.
+'''
+
+import struct
+import types
+import itertools
+
+import numpy
+
+JID_NULL = 0x00
+JID_MAP_BEGIN = 0x7b
+JID_MAP_END = 0x7d
+JID_ARRAY_BEGIN = 0x5b
+JID_ARRAY_END = 0x5d
+JID_BOOL = 0x10
+JID_INT8 = 0x11
+JID_INT16 = 0x12
+JID_INT32 = 0x13
+JID_INT64 = 0x14
+JID_REAL16 = 0x18
+JID_REAL32 = 0x19
+JID_REAL64 = 0x1a
+JID_UINT8 = 0x21
+JID_UINT16 = 0x22
+JID_STRING = 0x27
+JID_FALSE = 0x30
+JID_TRUE = 0x31
+JID_TOKENDEF = 0x2b
+JID_TOKENREF = 0x26
+JID_TOKENUNDEF = 0x2d
+JID_UNIFORM_ARRAY = 0x40
+JID_MAGIC = 0x7f
+
+MAGIC = struct.pack('<BI', JID_MAGIC, 0x624a534e)     # 0x7f "NSJb"
+
+# numpy types of the numeric tokens
+_DTYPES = {
+    JID_INT8 : numpy.dtype('<i1'),
+    JID_INT16 : numpy.dtype('<i2'),
+    JID_INT32 : numpy.dtype('<i4'),
+    JID_INT64 : numpy.dtype('<i8'),
+    JID_REAL16 : numpy.dtype('<f2'),
+    JID_REAL32 : numpy.dtype('<f4'),
+    JID_REAL64 : numpy.dtype('<f8'),
+    JID_UINT8 : numpy.dtype('<u1'),
+    JID_UINT16 : numpy.dtype('<u2'),
+}
+_INTS = [ JID_INT8, JID_INT16, JID_INT32, JID_INT64 ]
+_RANGES = [ (jid, numpy.iinfo(_DTYPES[jid]).min, numpy.iinfo(_DTYPES[jid]).max) for jid in _INTS ]
+_FORMATS = { JID_INT8 : '<Bb', JID_INT16 : '<Bh', JID_INT32 : '<Bi', JID_INT64 : '<Bq' }
+
+_FLUSH = 1 << 16
+_TOKENLEN = 64      # longer strings are written inline rather than as tokens
+
+def isBinary(head):
+    ''' True if the leading bytes of a file are the binary JSON magic '''
+    return head[:len(MAGIC)] == MAGIC
+
+def _packLength(n):
+    if n < 0xf1:
+        return chr(n)
+    if n < 0x10000:
+        return struct.pack('<BH', 0xf2, n)
+    if n < 0x100000000:
+        return struct.pack('<BI', 0xf4, n)
+    return struct.pack('<BQ', 0xf8, n)
+
+def _intType(lo, hi):
+    ''' The smallest int token holding the range lo..hi '''
+    for jid, tmin, tmax in _RANGES:
+        if lo >= tmin and hi <= tmax:
+            return jid
+    raise OverflowError('%d..%d does not fit a 64 bit int' % (lo, hi))
+
+def _realType(values):
+    ''' real32 if every value survives the round trip, otherwise real64 '''
+    if numpy.array_equal(values.astype('<f4').astype(values.dtype), values):
+        return JID_REAL32
+    return JID_REAL64
+
+def _arrayType(a):
+    ''' The token to store a numeric numpy array with, or None '''
+    if a.size == 0:
+        return None
+    if a.dtype.kind in 'iu':
+        return _intType(int(a.min()), int(a.max()))
+    if a.dtype == numpy.float32:
+        return JID_REAL32
+    if a.dtype.kind == 'f':
+        return _realType(a)
+    return None
+
+def _numericList(obj):
+    ''' obj as a numpy array if it is a flat list, or a list of equal sized tuples, of only
+        ints or only floats.  None otherwise. '''
+    if not obj or isinstance(obj[0], (list, tuple)) and not obj[0]:
+        return None
+    if isinstance(obj[0], (list, tuple)):
+        try:
+            kinds = set(map(type, itertools.chain.from_iterable(obj)))
+        except TypeError:
+            return None     # not all of the elements are lists
+    else:
+        kinds = set(map(type, obj))
+    if not (kinds <= set([int, long]) or kinds == set([float])):
+        return None
+    try:
+        a = numpy.asarray(obj)
+    except (ValueError, OverflowError):
+        return None
+    if a.dtype.kind not in 'iuf' or a.ndim not in (1, 2):
+        return None
+    return a
+
+
+class Writer(object):
+    ''' Encodes values to a file object, buffering the output '''
+    def __init__(self, fp):
+        self.fp = fp
+        self.buf = []
+        self.size = 0
+        self.tokens = {}
+
+    def put(self, data):
+        self.buf.append(data)
+        self.size += len(data)
+        if self.size >= _FLUSH:
+            self.flush()
+
+    def flush(self):
+        self.fp.write(''.join(self.buf))
+        self.buf = []
+        self.size = 0
+
+    def string(self, s):
+        if isinstance(s, unicode):
+            s = s.encode('utf-8')
+        if len(s) > _TOKENLEN:
+            self.put(chr(JID_STRING) + _packLength(len(s)) + s)
+            return
+        tid = self.tokens.get(s)
+        if tid is None:
+            tid = len(self.tokens)
+            self.tokens[s] = tid
+            self.put(chr(JID_TOKENDEF) + _packLength(tid) + _packLength(len(s)) + s)
+        self.put(chr(JID_TOKENREF) + _packLength(tid))
+
+    def number(self, value):
+        if isinstance(value, float):
+            f = numpy.float32(value)
+            if f == value or value != value:
+                self.put(struct.pack('<Bf', JID_REAL32, f))
+            else:
+                self.put(struct.pack('<Bd', JID_REAL64, value))
+        else:
+            jid = _intType(value, value)
+            self.put(struct.pack(_FORMATS[jid], jid, value))
+
+    def uniform(self, a, jid):
+        ''' a 1D array as a uniform array block '''
+        self.put(chr(JID_UNIFORM_ARRAY) + chr(jid) + _packLength(len(a)))
+        self.put(a.astype(_DTYPES[jid]).tostring())
+
+    def tuples(self, a, jid):
+        ''' a 2D array as an array of uniform arrays, one per row, or a 3D array as
+            an array of arrays of them, built in one block '''
+        width = a.shape[-1]
+        head = chr(JID_UNIFORM_ARRAY) + chr(jid) + _packLength(width)
+        row = [('head', 'S%d' % len(head)), ('data', _DTYPES[jid], (width,))]
+        if a.ndim == 3:
+            rows = numpy.empty(len(a), dtype=[('open', 'S1'), ('rows', row, (a.shape[1],)),
+                                              ('close', 'S1')])
+            rows['open'] = chr(JID_ARRAY_BEGIN)
+            rows['close'] = chr(JID_ARRAY_END)
+            rows['rows']['head'] = head
+            rows['rows']['data'] = a
+        else:
+            rows = numpy.empty(len(a), dtype=row)
+            rows['head'] = head
+            rows['data'] = a
+        self.put(chr(JID_ARRAY_BEGIN))
+        self.put(rows.tostring())
+        self.put(chr(JID_ARRAY_END))
+
+    def array(self, a):
+        jid = _arrayType(a)
+        if jid is None:
+            self.sequence(a.tolist())
+        elif a.ndim == 1:
+            self.uniform(a, jid)
+        elif a.ndim in (2, 3) and a.shape[-1] and a.shape[1]:
+            self.tuples(a, jid)
+        else:
+            self.sequence(a.tolist())
+
+    def sequence(self, items):
+        self.put(chr(JID_ARRAY_BEGIN))
+        for item in items:
+            self.value(item)
+        self.put(chr(JID_ARRAY_END))
+
+    def value(self, obj):
+        if obj is None:
+            self.put(chr(JID_NULL))
+        elif obj is True:
+            self.put(chr(JID_TRUE))
+        elif obj is False:
+            self.put(chr(JID_FALSE))
+        elif isinstance(obj, (int, long, float)):
+            self.number(obj)
+        elif isinstance(obj, basestring):
+            self.string(obj)
+        elif isinstance(obj, numpy.ndarray):
+            self.array(obj)
+        elif isinstance(obj, numpy.generic):
+            self.value(obj.item())
+        elif isinstance(obj, (list, tuple)):
+            a = _numericList(obj)
+            if a is None:
+                self.sequence(obj)
+            else:
+                self.array(a)
+        elif isinstance(obj, types.GeneratorType):
+            self.sequence(obj)
+        elif isinstance(obj, dict):
+            self.put(chr(JID_MAP_BEGIN))
+            for key in obj:
+                self.string(key)
+                self.value(obj[key])
+            self.put(chr(JID_MAP_END))
+        else:
+            raise TypeError(repr(obj) + " is not JSON serializable")
+
+
+def dump(obj, fp):
+    ''' Write obj to fp as binary JSON '''
+    w = Writer(fp)
+    w.put(MAGIC)
+    w.value(obj)
+    w.flush()
+
+def dumps(obj):
+    import cStringIO
+    fp = cStringIO.StringIO()
+    dump(obj, fp)
+    return fp.getvalue()
+
+
+# struct codes of the numeric tokens, for short arrays and scalars
+_CODES = {
+    JID_INT8 : 'b', JID_INT16 : 'h', JID_INT32 : 'i', JID_INT64 : 'q',
+    JID_REAL32 : 'f', JID_REAL64 : 'd', JID_UINT8 : 'B', JID_UINT16 : 'H',
+}
+_SHORT = 16
+
+
+class Reader(object):
+    ''' Decodes a binary JSON string '''
+    def __init__(self, data, arrays=False):
+        self.data = bytearray(data)
+        self.pos = 0
+        self.tokens = {}
+        self.arrays = arrays
+
+    def unpack(self, fmt, size):
+        value = struct.unpack_from(fmt, self.data, self.pos)[0]
+        self.pos += size
+        return value
+
+    def length(self):
+        n = self.data[self.pos]
+        self.pos += 1
+        if n < 0xf1:
+            return n
+        if n == 0xf2:
+            return self.unpack('<H', 2)
+        if n == 0xf4:
+            return self.unpack('<I', 4)
+        if n == 0xf8:
+            return self.unpack('<Q', 8)
+        raise ValueError('Bad length encoding 0x%x at %d' % (n, self.pos-1))
+
+    def string(self):
+        n = self.length()
+        # strings come back as unicode, as the json module returns them
+        s = str(self.data[self.pos:self.pos+n]).decode('utf-8')
+        self.pos += n
+        return s
+
+    def uniform(self):
+        jid = self.data[self.pos]
+        self.pos += 1
+        n = self.length()
+        if jid == JID_BOOL:
+            # bits packed into 32 bit words
+            words = (n + 31) // 32
+            bits = numpy.frombuffer(self.data, '<u4', words, self.pos)
+            self.pos += 4 * words
+            bits = numpy.unpackbits(bits.view(numpy.uint8)).reshape(-1, 8)[:, ::-1]
+            return bits.ravel()[:n].astype(bool).tolist()
+        dtype = _DTYPES[jid]
+        if n <= _SHORT and jid in _CODES and not self.arrays:
+            values = list(struct.unpack_from('<%d%s' % (n, _CODES[jid]), self.data, self.pos))
+        else:
+            values = numpy.frombuffer(self.data, dtype, n, self.pos)
+            if not self.arrays:
+                values = values.tolist()
+        self.pos += n * dtype.itemsize
+        return values
+
+    def tuples(self):
+        ''' Fast path for an array of equal uniform arrays, as written by Writer.tuples.
+            Returns the rows it could read in one block, leaving the rest to the caller. '''
+        start = self.pos
+        data = self.data
+        if start + 2 >= len(data):
+            return []
+        jid = data[start+1]
+        width = data[start+2]
+        if jid not in _DTYPES or width == 0 or width >= 0xf1:
+            return []
+        dtype = _DTYPES[jid]
+        size = 3 + width * dtype.itemsize
+        if start + 2 * size > len(data) or data[start+size:start+size+3] != data[start:start+3]:
+            return []   # not a run of rows, read it the slow way
+        head = str(data[start:start+3])
+        n = (len(data) - start) // size
+        rows = numpy.frombuffer(data, [('head', 'S3'), ('data', dtype, (width,))], n, start)
+        bad = numpy.flatnonzero(rows['head'] != head)
+        if len(bad):
+            n = bad[0]
+        self.pos = start + n * size
+        if self.arrays and data[self.pos] == JID_ARRAY_END:
+            return rows['data'][:n]
+        return rows['data'][:n].tolist()
+
+    def wrapped(self):
+        ''' Fast path for an array of arrays holding one uniform array each (as
+            Writer.tuples writes a 3D array), the layout of a primitive run. '''
+        start = self.pos
+        data = self.data
+        if start + 4 >= len(data) or data[start+1] != JID_UNIFORM_ARRAY:
+            return []
+        jid = data[start+2]
+        width = data[start+3]
+        if jid not in _DTYPES or width == 0 or width >= 0xf1:
+            return []
+        dtype = _DTYPES[jid]
+        size = 5 + width * dtype.itemsize
+        if start + 2 * size > len(data) or data[start+size-1] != JID_ARRAY_END or \
+                data[start+size:start+size+4] != data[start:start+4]:
+            return []
+        head = str(data[start:start+4])
+        n = (len(data) - start) // size
+        rows = numpy.frombuffer(data, [('head', 'S4'), ('data', dtype, (width,)),
+                                       ('close', 'S1')], n, start)
+        bad = numpy.flatnonzero((rows['head'] != head) | (rows['close'] != chr(JID_ARRAY_END)))
+        if len(bad):
+            n = bad[0]
+        self.pos = start + n * size
+        if self.arrays and data[self.pos] == JID_ARRAY_END:
+            return rows['data'][:n].reshape(n, 1, width)
+        return [ [row] for row in rows['data'][:n].tolist() ]
+
+    def value(self):
+        data = self.data
+        jid = data[self.pos]
+        self.pos += 1
+        while jid == JID_TOKENDEF or jid == JID_TOKENUNDEF:
+            tid = self.length()
+            if jid == JID_TOKENDEF:
+                self.tokens[tid] = self.string()
+            else:
+                self.tokens.pop(tid, None)
+            jid = data[self.pos]
+            self.pos += 1
+        if jid == JID_TOKENREF:
+            n = data[self.pos]
+            if n < 0xf1:
+                self.pos += 1
+                return self.tokens[n]
+            return self.tokens[self.length()]
+        if jid == JID_ARRAY_BEGIN:
+            items = []
+            if data[self.pos] == JID_UNIFORM_ARRAY:
+                items = self.tuples()
+            elif data[self.pos] == JID_ARRAY_BEGIN:
+                items = self.wrapped()
+            if isinstance(items, numpy.ndarray):
+                self.pos += 1
+                return items
+            value = self.value
+            append = items.append
+            while data[self.pos] != JID_ARRAY_END:
+                append(value())
+            self.pos += 1
+            return items
+        if jid == JID_UNIFORM_ARRAY:
+            return self.uniform()
+        if jid in _CODES:
+            return self.unpack('<' + _CODES[jid], _DTYPES[jid].itemsize)
+        if jid == JID_FALSE:
+            return False
+        if jid == JID_TRUE:
+            return True
+        if jid == JID_NULL:
+            return None
+        if jid == JID_STRING:
+            return self.string()
+        if jid == JID_MAP_BEGIN:
+            items = {}
+            while data[self.pos] != JID_MAP_END:
+                key = self.value()
+                items[key] = self.value()
+            self.pos += 1
+            return items
+        if jid == JID_REAL16:
+            value = numpy.frombuffer(data, '<f2', 1, self.pos)[0].item()
+            self.pos += 2
+            return value
+        if jid == JID_BOOL:
+            self.pos += 1
+            return data[self.pos-1] != 0
+        raise ValueError('Unknown token 0x%x at %d' % (jid, self.pos-1))
+
+
+def loads(data, arrays=False):
+    ''' Decode a binary JSON string, which must start with the magic.  With arrays,
+        uniform arrays (and arrays of equal uniform arrays) come back as numpy arrays
+        viewing the decoded buffer instead of lists. '''
+    if not isBinary(data):
+        raise ValueError('Not binary JSON')
+    r = Reader(data, arrays)
+    r.pos = len(MAGIC)
+    return r.value()
+
+def load(fp, arrays=False):
+    return loads(fp.read(), arrays)
@@ -0,0 +1,171 @@
+#! /usr/bin/env python2.6
+
+""" Space colonization: grows a tree to fill a volume of attractor points.
+
+Each step every attractor finds its nearest tree point with a spatial index. An
+attractor within killDistance of the tree has been reached and is removed, the others pull
+their nearest point if it is within influence. Every pulled point grows one child a step
+towards the mean direction of its attractors, all in one go with numpy. Until an attractor
+is in reach (a seedling far below its crown) the newest points grow straight on along their
+direction, so the trunk grows up to the crown.
+
+    colonizer = colonize.Colonizer(colonize.shapeAttractors(100000, "ellipsoid", (0, 12, 0), (6, 5, 6)))
+    tree.makeTree(control=control, colonizer=colonizer)
+
+Attractors can also be loaded from the points of a .geo or .bgeo file with loadAttractors.
+"""
+
+import numpy as np
+
+import hgeo
+import spatial
+import treerand
+import treemath as tm
+import runtree
+
+SHAPES = ("ellipsoid", "box")
+
+
+def shapeAttractors(count, shape="ellipsoid", center=(0.0, 10.0, 0.0), size=(5.0, 5.0, 5.0), seed=0.0):
+    """ returns (count,3) points spread evenly through a shape: an ellipsoid with radii size, or a
+        box with half widths size, around center. The points come from the counter based rng,
+        so a seed always gives the same cloud."""
+    if shape not in SHAPES:
+        raise ValueError("unknown attractor shape %r, expected one of %s" % (shape, ", ".join(SHAPES)))
+    rng = treerand.CounterRNG(seed)
+    keys = np.arange(count, dtype=np.uint64)
+    if shape == "ellipsoid":
+        radius = np.cbrt(rng.uniform(keys, treerand.PURPOSE_ATTRACT)[:, 0])
+        unit = rng.unitVectors(keys, treerand.PURPOSE_DIR) * radius[:, None]
+    else:
+        unit = 2.0 * rng.uniform(keys, treerand.PURPOSE_ATTRACT, 3) - 1.0
+    return np.asarray(center, dtype=np.float64) + unit * np.asarray(size, dtype=np.float64)
+
+
+def loadAttractors(filename, attribute="P"):
+    """ returns the (N,3) point positions of a .geo or .bgeo file, read through hgeo.Detail """
+    detail = hgeo.Detail()
+    with open(filename, "rb") as fp:
+        detail.loadJSON(fp, lazy=True)
+    if attribute not in detail.PointAttributes:
+        raise ValueError("%s has no point attribute %s" % (filename, attribute))
+    return np.asarray(detail.PointAttributes[attribute].Array[:, :3], dtype=np.float64)
+
+
+class Colonizer(object):
+    """ grows a Tree towards a cloud of attractors, one step per grow() call.
+        influence    -- attractors further than this from the tree do not pull it
+        killDistance -- attractors this close to the tree are removed
+        stepSize     -- length of each new branch segment
+        Distances left as None are multiples of Control.stepSize (8, 2 and 1 steps).
+
+        Every attractor remembers its nearest tree point. Points never move, so a step only has
+        to look for attractors around the points added since the last step, in a spatial index
+        over the attractors: the work of a step follows the number of new points, not the size
+        of the tree."""
+
+    def __init__(self, attractors, influence=None, killDistance=None, stepSize=None):
+        self.attractors = np.array(attractors, dtype=np.float64).reshape(-1, 3)
+        self.influence = influence
+        self.killDistance = killDistance
+        self.stepSize = stepSize
+        self.nearest = np.full(len(self.attractors), -1, dtype=np.int64)
+        self.distance = np.full(len(self.attractors), np.inf)
+        self.alive = np.ones(len(self.attractors), dtype=bool)
+        self.reached = False
+        self.index = None
+        self.seen = 0
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def _distances(self):
+        step = self.stepSize or runtree.Control.stepSize
+        influence = self.influence or 8.0 * step
+        kill = self.killDistance or 2.0 * step
+        return step, influence, kill
+
+    def _reindex(self, influence):
+        """ indexes the live attractors, by their number, in cells of half the influence """
+        live = np.flatnonzero(self.alive)
+        self.index = spatial.SpatialHash(0.5 * influence)
+        self.index.insert(self.attractors[live], live)
+        self.indexed = len(live)
+
+    def update(self, tree):
+        """ brings the nearest tree point of every attractor up to date with the points added
+            since the last update, and removes the attractors within killDistance """
+        step, influence, kill = self._distances()
+        if self.index is None or self.index.cellSize != 0.5 * influence or self.seen > len(tree.points):
+            self.nearest[:] = -1
+            self.distance[:] = np.inf
+            self.seen = 0
+            self.alive[:] = True
+            self.reached = False
+            self._reindex(influence)
+        elif 2 * self.alive.sum() < self.indexed:
+            self._reindex(influence)
+        pos = tree.points.column("pos")
+        found, offsets, dist = self.index.radius(pos[self.seen:], influence)
+        nodes = np.repeat(np.arange(self.seen, len(pos)), np.diff(offsets))
+        self.seen = len(pos)
+        # the nearest of the new points to each attractor, if it beats the one it has
+        closer = dist < self.distance[found]
+        found, nodes, dist = found[closer], nodes[closer], dist[closer]
+        order = np.argsort(found * (influence + 1.0) + dist)
+        found, nodes, dist = found[order], nodes[order], dist[order]
+        first = np.flatnonzero(np.diff(np.concatenate(([-1], found))))
+        self.nearest[found[first]] = nodes[first]
+        self.distance[found[first]] = dist[first]
+        killed = self.alive & (self.distance <= kill)
+        self.reached |= killed.any()
+        self.alive &= ~killed
+
+    def grow(self, tree):
+        """ grows tree by one step, removing the attractors it reached. Returns the new point ids. """
+        step, influence, kill = self._distances()
+        self.update(tree)
+        pos = tree.points.column("pos")
+        pulled = np.flatnonzero(self.alive & (self.nearest >= 0))
+        if len(pulled) or self.reached:
+            tips, heading = self._pull(pos, pulled)
+        else:
+            # no attractor reached or in reach yet: the newest points carry straight on, so the
+            # trunk grows up to the crown
+            born = tree.points.column("birthStep")
+            tips = np.flatnonzero(born == born.max())
+            heading = tm.batchNorm(tree.points.column("dir")[tips])
+        target = pos[tips] + heading * step
+        taken = self._taken(tree, target, step)
+        # a point caught between attractors whose pulls cancel would grow the child it already
+        # has; it carries straight on instead, once, and after that its attractors are dropped
+        straight = pos[tips[taken]] + tm.batchNorm(tree.points.column("dir")[tips[taken]]) * step
+        target[taken] = straight
+        taken[taken] = self._taken(tree, straight, step)
+        stuck = np.in1d(self.nearest[pulled], tips[taken])
+        self.alive[pulled[stuck]] = False
+        tips, target = tips[~taken], target[~taken]
+        room = max(runtree.Control.maxPoints - len(tree.points), 0)
+        tips, target = tips[:room], target[:room]
+        ids = tree.addChildren(tips, target, np.full(len(tips), tree.currentStep, dtype=np.uint64))
+        tree.currentStep += 1
+        return ids
+
+    def _pull(self, pos, pulled):
+        """ the points pulled by the attractors pulled, and the mean direction of their pulls """
+        if not len(pulled):
+            return pulled, np.empty((0, 3))
+        # sum the unit pulls of each point's attractors
+        nodes = self.nearest[pulled]
+        pull = tm.batchNorm(self.attractors[pulled] - pos[nodes])
+        tips, which = np.unique(nodes, return_inverse=True)
+        total = np.column_stack([np.bincount(which, pull[:, i], len(tips)) for i in range(3)])
+        length = np.sqrt((total ** 2).sum(1))
+        keep = length > 1e-9
+        return tips[keep], total[keep] / length[keep, None]
+
+    def _taken(self, tree, target, step):
+        """ True for each target position where the tree already has a point """
+        if not len(target):
+            return np.zeros(0, dtype=bool)
+        return tree.spatialIndex().nearest(target, 1, maxDistance=0.1 * step)[0][:, 0] >= 0
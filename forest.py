@@ -0,0 +1,175 @@
+#! /usr/bin/env python2.6
+
+""" Grows many trees at once in a process pool.
+
+Each tree is a base Control plus a seed and optional parameter overrides. Because growth
+draws its random numbers from the counter based rng (treerand), a tree comes out the same
+bit for bit whichever worker grows it and in whatever order.
+
+Workers hand back each tree's point columns as numpy arrays, which pickle as raw buffers,
+or write the tree to a file and hand back only the file name.
+
+growSubtrees does the same for the branches of one big tree: the trunk is grown here up to a
+split step, every point of its last generation is grown out by a worker, and the subtrees are
+stitched back in the order a serial makeTree would have numbered them.
+"""
+
+import os
+import sys
+import multiprocessing
+
+import numpy as np
+
+from runtree import Control, Tree
+
+
+def treeColumns(tree):
+    """ returns the live point columns of a tree as a dict of compact numpy arrays """
+    cols = {}
+    for name, col in tree.points.columns().items():
+        cols[name] = col.copy()
+    return cols
+
+
+def _growOne(job):
+    """ pool worker: grows one tree and returns its columns, or its file name when writing """
+    values, seed, overrides, outdir, batched = job
+    control = Control(None, **values)
+    control.update(seed=seed, **overrides)
+    tree = Tree()
+    tree.makeTree(batched=batched, control=control)
+    if outdir is None:
+        return treeColumns(tree)
+    filename = os.path.join(outdir, "tree_%s.tree" % repr(control.seed))
+    tree.saveFile(filename)
+    return filename
+
+
+def growForest(control, seeds, overrides=None, workers=None, outdir=None, batched=True):
+    """ grows one tree per seed and returns the results in seed order.
+        control   -- base Control, copied for every tree
+        seeds     -- list or range of seeds
+        overrides -- dict of parameters applied to every tree, or a list with one dict per seed
+        workers   -- number of processes, None for one per cpu. 1 grows in this process.
+        outdir    -- when given, each tree is written there and its file name is returned,
+                     otherwise each result is a dict of point columns (see treeColumns)"""
+    seeds = list(seeds)
+    if overrides is None:
+        overrides = {}
+    if isinstance(overrides, dict):
+        overrides = [overrides] * len(seeds)
+    if len(overrides) != len(seeds):
+        raise ValueError("need one overrides dict per seed")
+    if outdir is not None and not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    values = control.values()
+    jobs = [(values, seed, o, outdir, batched) for seed, o in zip(seeds, overrides)]
+    results = _runPool(_growOne, jobs, workers)
+    control.apply()
+    return results
+
+
+def _runPool(func, jobs, workers):
+    if workers == 1:
+        return [func(job) for job in jobs]
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(func, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _growSubtree(job):
+    """ pool worker: grows the subtree under one trunk point, which becomes local point 0.
+        Returns the columns of every point below it, parentIds are local."""
+    values, root, startStep, batched = job
+    control = Control(None, **values)
+    tree = Tree()
+    for name, value in root.items():
+        if name != "id":
+            tree.points.column(name)[0] = value
+    tree.currentStep = startStep
+    tree.makeTree(batched=batched, control=control)
+    cols = {}
+    for name, col in tree.points.columns().items():
+        cols[name] = col[1:].copy()
+    return cols
+
+
+def growSubtrees(control, splitStep, workers=None, batched=True):
+    """ grows one tree, handing each branch to a worker once the trunk is splitStep generations
+        deep. Returns the Tree, with the same points in the same order as tree.makeTree(control=control)."""
+    trunk = Tree()
+    trunk.makeTree(batched=batched, control=control, steps=splitStep)
+    store = trunk.points
+    maxPoints = control.maxPoints
+    front = np.flatnonzero(store.column("split") > 0)
+    room = maxPoints - len(store)
+    if trunk.currentStep >= control.stepNum or len(front) == 0 or room <= 0:
+        trunk.makeTree(batched=batched, control=control)
+        return trunk
+
+    # no subtree can keep more than room points of the serial tree, so that caps each worker
+    values = control.values()
+    values["maxPoints"] = room + 1
+    jobs = []
+    for f in front:
+        root = {}
+        for name in store.names:
+            root[name] = store.column(name)[f].copy()
+        jobs.append((values, root, trunk.currentStep, batched))
+    parts = _runPool(_growSubtree, jobs, workers)
+    control.apply()
+    # the trunk's last generation has now been grown from
+    store.column("split")[front] = 0
+
+    # concatenate the subtrees; globalIds maps a row of the concatenation (plus one slot per
+    # subtree root) to its id in the stitched tree
+    counts = np.array([len(p["id"]) for p in parts])
+    if counts.sum() == 0:
+        trunk.currentStep = control.stepNum
+        return trunk
+    cols = {}
+    for name in store.names:
+        cols[name] = np.concatenate([p[name] for p in parts])
+    bases = np.cumsum(counts + 1) - (counts + 1)
+    slot = np.repeat(bases, counts) + cols["id"]
+    localParent = np.repeat(bases, counts) + cols["parentId"]
+    globalIds = np.zeros(counts.sum() + len(parts), dtype=np.int64)
+    globalIds[bases] = front
+
+    # serial numbering: generation by generation, then by parent id, then sibling order
+    order = []
+    parentIds = []
+    nextId = len(store)
+    birth = cols["birthStep"]
+    for b in np.unique(birth):
+        rows = np.flatnonzero(birth == b)
+        gp = globalIds[localParent[rows]]
+        sort = np.lexsort((cols["id"][rows], gp))
+        rows = rows[sort]
+        globalIds[slot[rows]] = np.arange(nextId, nextId + len(rows))
+        nextId += len(rows)
+        order.append(rows)
+        parentIds.append(gp[sort])
+    order = np.concatenate(order)[:room]
+    parentIds = np.concatenate(parentIds)[:room]
+
+    first = store.add(len(order))
+    for name in store.names:
+        if name != "id":
+            store.column(name)[first:] = cols[name][order]
+    store.column("parentId")[first:] = parentIds
+    trunk.TOTAL = len(store) - 1
+    trunk.currentStep = control.stepNum
+    return trunk
+
+
+if __name__ == "__main__":
+    # forest.py first last [workers [outdir]]  grows seeds first..last-1 from control.txt
+    first, last = int(sys.argv[1]), int(sys.argv[2])
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    outdir = sys.argv[4] if len(sys.argv) > 4 else "forest"
+    for name in growForest(Control("control.txt"), range(first, last), workers=workers, outdir=outdir):
+        print name
@@ -0,0 +1,276 @@
+'''
+    Streaming JSON for the Houdini geometry schema.
+
+    writeJSON writes the same text as json.dump(obj, fp) (no indent), but a piece at a
+    time: lists and generators are written element by element, and long runs of numbers
+    (lists or numpy arrays) are encoded a chunk at a time.  Nothing larger than one chunk is
+    ever held as text, and generators let the caller build each block just before it is
+    written.
+
+    JSONTokens goes the other way, walking a file a buffer at a time so that big numeric
+    lists can be decoded straight into arrays (see Detail.loadStream).
+'''
+
+import re
+import json
+import types
+import string
+
+import numpy
+
+CHUNK = 4096
+_SHORT = 64
+
+def _isLazy(obj):
+    return isinstance(obj, (numpy.ndarray, types.GeneratorType))
+
+def _plain(obj):
+    ''' json default hook, for arrays or generators nested inside a chunk '''
+    if isinstance(obj, numpy.ndarray):
+        return obj.tolist()
+    if isinstance(obj, types.GeneratorType):
+        return list(obj)
+    raise TypeError(repr(obj) + " is not JSON serializable")
+
+def _writeChunks(fp, values, chunk):
+    ''' Write the contents of a list/array (no brackets), chunk by chunk '''
+    for start in xrange(0, len(values), chunk):
+        part = values[start:start+chunk]
+        if isinstance(part, numpy.ndarray):
+            part = part.tolist()
+        if start:
+            fp.write(', ')
+        fp.write(json.dumps(part, default=_plain)[1:-1])
+
+def _writeItems(fp, items, chunk):
+    first = True
+    for item in items:
+        if not first:
+            fp.write(', ')
+        first = False
+        writeJSON(fp, item, chunk)
+
+def writeJSON(fp, obj, chunk=CHUNK):
+    ''' Write obj to fp as JSON, exactly as json.dump(obj, fp) would '''
+    if isinstance(obj, numpy.ndarray):
+        fp.write('[')
+        _writeChunks(fp, obj, chunk)
+        fp.write(']')
+    elif isinstance(obj, (list, tuple)):
+        fp.write('[')
+        if len(obj) > _SHORT and not _isLazy(obj[0]):
+            # a long run of values or tuples, such as attribute values or vertex indices
+            _writeChunks(fp, obj, chunk)
+        else:
+            _writeItems(fp, obj, chunk)
+        fp.write(']')
+    elif isinstance(obj, types.GeneratorType):
+        fp.write('[')
+        _writeItems(fp, obj, chunk)
+        fp.write(']')
+    else:
+        fp.write(json.dumps(obj))
+
+
+class JSONTokens(object):
+    ''' Reads a JSON document from a file a piece at a time.  The caller walks the
+        structure: enter() and leave() step in and out of lists, value() parses one
+        complete (small) value, and numbers() decodes a whole numeric list, nested or
+        not, straight into a flat numpy array without building Python objects.  Only a
+        buffer's worth of the file is held at once. '''
+
+    _SKIP = re.compile(r'[\s,:]*')
+    _NUMERIC = re.compile(r'[^0-9.eE+\-\s,\[\]]')
+    _BRACKETS = string.maketrans('[]', '  ')
+    _EMPTY = re.compile(r'\[\s*\]')
+    _DIGITS = numpy.zeros(256, dtype=bool)
+    _DIGITS[numpy.frombuffer('0123456789.eE+-', numpy.uint8)] = True
+
+    def __init__(self, fp, bufsize=1<<20):
+        self.fp = fp
+        self.bufsize = bufsize
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size=None):
+        ''' Read more of the file, dropping what has been consumed.  Returns False at
+            the end of the file. '''
+        if self.eof:
+            return False
+        data = self.fp.read(size or self.bufsize)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        ''' The next significant character, skipping separators, or '' at the end '''
+        while True:
+            self.pos = self._SKIP.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def enter(self):
+        ''' Step into the list starting here '''
+        if self.peek() != '[':
+            raise ValueError('Expected a list at %r' % self.buf[self.pos:self.pos+40])
+        self.pos += 1
+
+    def more(self):
+        ''' True if the current list has another element, otherwise leave the list '''
+        c = self.peek()
+        if c == ']':
+            self.pos += 1
+            return False
+        if not c:
+            raise ValueError('Unexpected end of file')
+        return True
+
+    def value(self):
+        ''' Parse the complete value starting here '''
+        self.peek()
+        size = self.bufsize
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number could carry on past the end of the buffer
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except ValueError:
+                if self.eof:
+                    raise
+            # the value is cut off by the end of the buffer, read (ever more) data
+            self.fill(size)
+            size *= 2
+
+    def skip(self):
+        ''' Step over the value starting here '''
+        if self.peek() == '[' and self._numericAhead():
+            self.numbers(numpy.float64)
+        else:
+            self.value()
+
+    def _numericAhead(self):
+        return not self._NUMERIC.search(self.buf, self.pos, self.pos + 256)
+
+    def _closing(self, depth):
+        ''' The offset in the buffer where the bracket depth reaches 0, or -1 '''
+        chars = numpy.frombuffer(self.buf, numpy.uint8)[self.pos:]
+        steps = (chars == ord('[')).astype(numpy.int8) - (chars == ord(']'))
+        levels = depth + numpy.cumsum(steps)
+        closed = numpy.flatnonzero(levels == 0)
+        if len(closed):
+            return self.pos + closed[0]
+        return -1
+
+    def _parse(self, text, dtype):
+        empty = self._EMPTY.search(text)
+        text = text.translate(self._BRACKETS)
+        if empty:
+            # an empty list leaves a blank between its separators, which would read as 0
+            text = ','.join(f for f in text.split(',') if f.strip())
+        if not text.strip():
+            return numpy.empty(0, dtype)
+        if self._NUMERIC.search(text):
+            raise ValueError('Expected only numbers in %r...' % text[:40])
+        kind = numpy.int64 if numpy.dtype(dtype).kind in 'iub' else numpy.float64
+        values = numpy.fromstring(text, dtype=kind, sep=',')
+        if len(values) != text.count(',') + 1:
+            raise ValueError('Bad number list %r...' % text[:40])
+        return values
+
+    def _numberTexts(self):
+        ''' The text of the numeric list starting here, a piece at a time.  Each piece
+            ends after a separator, so no number is cut in two.  Yields (text, depth), the
+            bracket depth at the start of the piece, 1 being inside the list itself. '''
+        self.enter()
+        depth = 1
+        while True:
+            end = self._closing(depth)
+            if end >= 0:
+                text = self.buf[self.pos:end]
+                self.pos = end + 1
+                yield text, depth
+                return
+            # everything up to the last separator, a number may be cut off
+            cut = self.buf.rfind(',', self.pos)
+            if cut < 0:
+                if not self.fill():
+                    raise ValueError('Unexpected end of file')
+                continue
+            text = self.buf[self.pos:cut]
+            self.pos = cut + 1
+            yield text, depth
+            depth += text.count('[') - text.count(']')
+            self.fill()
+
+    def _store(self, values, out, count):
+        if count + len(values) > out.size:
+            raise ValueError('More than the %d values expected' % out.size)
+        out.flat[count:count+len(values)] = values
+
+    def numbers(self, dtype, out=None):
+        ''' Decode the list of numbers (or list of lists of numbers) starting here.
+            The values are written, flattened, into out if given, otherwise into a new
+            array.  Returns the array of the values read. '''
+        parts = []
+        count = 0
+        for text, depth in self._numberTexts():
+            values = self._parse(text, dtype)
+            if out is not None:
+                self._store(values, out, count)
+            else:
+                parts.append(values.astype(dtype))
+            count += len(values)
+        if out is not None:
+            return out.reshape(-1)[:count]
+        if parts:
+            return numpy.concatenate(parts)
+        return numpy.empty(0, dtype)
+
+    def numberLists(self, dtype, level, out=None):
+        ''' Like numbers(), for a list of lists of numbers whose lists at depth level
+            (1 being the list itself) are the ones that matter, such as the vertex lists
+            of a run of polygons.  Returns (values, sizes), sizes being the count of
+            numbers in each of those lists, in order.  Sizes are worked out from the
+            brackets and separators of each piece of text, not list by list. '''
+        parts = []
+        sizes = []
+        count = 0
+        for text, depth in self._numberTexts():
+            values = self._parse(text, dtype)
+            if out is not None:
+                self._store(values, out, count)
+            else:
+                parts.append(values.astype(dtype))
+            count += len(values)
+            chars = numpy.frombuffer(text, numpy.uint8)
+            level_at = depth + numpy.cumsum((chars == ord('[')).astype(numpy.int64) - (chars == ord(']')))
+            opens = (chars == ord('[')) & (level_at == level)
+            # a number starts wherever a number character follows anything else
+            digits = self._DIGITS[chars]
+            starts = digits & ~numpy.concatenate(([False], digits[:-1])) & (level_at == level)
+            # each start belongs to the list opened last; bin 0 is a list left open by the
+            # piece before
+            which = numpy.cumsum(opens)[starts]
+            counts = numpy.bincount(which, minlength=opens.sum() + 1)
+            if counts[0]:
+                sizes[-1][-1] += counts[0]
+            if len(counts) > 1:
+                sizes.append(counts[1:])
+        if out is not None:
+            values = out.reshape(-1)[:count]
+        elif parts:
+            values = numpy.concatenate(parts)
+        else:
+            values = numpy.empty(0, dtype)
+        if sizes:
+            return values, numpy.concatenate(sizes).astype(numpy.int64)
+        return values, numpy.empty(0, numpy.int64)
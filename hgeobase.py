@@ -0,0 +1,754 @@
+'''
+    The parts of hgeo that the Attribute and Detail classes are built on:
+    storage types, JSON helpers, paged data, groups and primitives.  The
+    class files import from here, never from hgeo, and hgeo re-exports it all.
+'''
+
+import os, sys, time
+import numpy
+
+VERBOSE = False
+_START = time.time()
+_LAP = _START
+
+_VERSION = '12.0.0'
+PAGESIZE = 1024     # Houdini's page size for paged attribute data
+
+# numpy types of the attribute storage names
+_STORAGE = {
+    'fpreal16' : numpy.float16,
+    'fpreal32' : numpy.float32,
+    'fpreal64' : numpy.float64,
+    'int8' : numpy.int8,
+    'int16' : numpy.int16,
+    'int32' : numpy.int32,
+    'int64' : numpy.int64,
+    'uint8' : numpy.uint8,
+}
+
+def _Assert(condition, message):
+    ''' Print out verbose information about processing '''
+    if not condition:
+        print message
+        sys.exit(1)
+
+def _Verbose(msg):
+    ''' Print out verbose information about processing '''
+    if VERBOSE:
+        global _LAP
+        now = time.time()
+        sys.stdout.write('+++ %6.3f (%6.3f): %s\n' % (now-_START, now-_LAP, msg))
+        _LAP = now
+        sys.stdout.flush()
+
+try:
+    import json  #was hjson
+except:
+    # If there's an issue loading hjson, fall back to simplejson.  This doesn't
+    # support binary JSON but works for ASCII files.
+    _Verbose('Falling back to simplejson')
+    import json  #was simplejson
+    json = json  #hjson = simplejson
+
+import bjson
+
+def listToDict(L):
+    # Since JSON doesn't enforce order for dictionary objects, the geometry
+    # schema often stores dictionaries as lists of name/value pairs.  This
+    # function will throw the list into a dictionary for easier access.
+    if L and type(L) == list:
+        d = {}
+        for i in xrange(0, len(L), 2):
+            d[L[i]] = L[i+1]
+        return d
+    return L
+
+def readJSON(fp):
+    ''' Parse a geometry file, binary (.bgeo) or ASCII (.geo), from an open file '''
+    data = fp.read()
+    if bjson.isBinary(data):
+        # number lists come back as numpy arrays, which is most of what makes .bgeo fast
+        return bjson.loads(data, arrays=True)
+    return json.loads(data)
+
+def _rawPageDataToTupleArray(raw, packing, pagesize, constflags, total_tuples):
+    ''' Marshall raw page data into an (N, tuple_size) numpy array '''
+    # Raw page data is stored interleaved as:
+    # [ <subvector0_page0> <subvector1_page0> <subvector2_page0>
+    #   <subvector0_page1> <subvector1_page1> <subvector2_page1>
+    #   <subvector0_page2> <subvector1_page2> <subvector2_page2>
+    #  ...
+    #   <subvector0_pageN> <subvector1_pageN> <subvector2_pageN>]
+    #
+    # <subvectorI_PageJ> will be a single subvector value if constflags[i][j]
+    # is True.  Otherwise it holds the subvector of every tuple on the page,
+    # one after the other, so it is a (tuples, packing[i]) block which is
+    # copied into its columns of the result with a single slice.
+    raw = numpy.asarray(raw)
+    tuple_size = sum(packing)
+    columns = numpy.cumsum([0] + list(packing))
+    n_pages = 0
+    # We can extract the number of pages from the length of a constant flag
+    # table if any subvectors have one.
+    if constflags is not None:
+        n_pages = reduce(lambda x,y: x if x > 0 else len(y), constflags, 0)
+    # Failing that, we know that raw contains no constant pages, and so we
+    # can compute the number of pages directly from the length of raw.
+    if n_pages == 0:
+        full_pagesize = tuple_size * pagesize
+        n_pages = (len(raw) + full_pagesize - 1) // full_pagesize
+
+    result = numpy.empty((total_tuples, tuple_size), dtype=raw.dtype)
+    varying = [False] * len(packing)
+    start = 0
+    raw_index = 0
+    # Iterate over the input pages
+    for i in xrange(0, n_pages):
+        if constflags is not None:
+            const = [len(x) > 0 and bool(x[i]) for x in constflags]
+        else:
+            const = varying
+        # The number of varying components on this page, and with the data
+        # left, the number of tuples it represents.  When the last page is
+        # constant for all the subvectors we load a single tuple and later
+        # duplicate it to create the remaining tuples.
+        n_const = sum(p for p, c in zip(packing, const) if c)
+        n_varying = tuple_size - n_const
+        raw_left = len(raw) - raw_index
+        if n_varying > 0:
+            n_tuples = min(pagesize, (raw_left - n_const) // n_varying)
+        else:
+            _Assert( raw_left >= tuple_size, "Expected more data" )
+            n_tuples = pagesize if raw_left > tuple_size else 1
+        _Assert( n_tuples > 0 and start + n_tuples <= total_tuples,
+                 "Expected more data" )
+
+        page = result[start:start+n_tuples]
+        for k, width in enumerate(packing):
+            if const[k]:
+                page[:, columns[k]:columns[k+1]] = raw[raw_index:raw_index+width]
+                raw_index += width
+            else:
+                size = width * n_tuples
+                page[:, columns[k]:columns[k+1]] = \
+                            raw[raw_index:raw_index+size].reshape(n_tuples, width)
+                raw_index += size
+        start += n_tuples
+
+    # Without using total_tuples we had no way of computing the size of the
+    # last page if it was constant for all the subvectors, so it was loaded
+    # as a single tuple.  Broadcast it over the missing tuples.
+    if constflags is not None and start:
+        result[start:] = result[start-1]
+        start = total_tuples
+
+    _Assert( start == total_tuples, "Expected more data" )
+    return result
+
+def _tupleArrayToRawPageData(values, packing, pagesize):
+    ''' Marshall an (N, tuple_size) array into raw page data, the inverse of
+        _rawPageDataToTupleArray.  A subvector which has the same value for every
+        tuple on a page is stored once for the page.  Returns the raw data and
+        the constant page flags (None when no page is constant). '''
+    values = numpy.asarray(values)
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+    n, tuple_size = values.shape
+    _Assert( sum(packing) == tuple_size, "Packing does not match the tuple size" )
+    columns = numpy.cumsum([0] + list(packing))
+    n_pages = (n + pagesize - 1) // pagesize
+
+    # const[k][i] is True when subvector k is constant over page i
+    const = numpy.zeros((len(packing), n_pages), dtype=bool)
+    first = values[::pagesize]
+    page_of = numpy.arange(n) // pagesize
+    same = values == first[page_of]
+    for k in xrange(len(packing)):
+        differs = ~same[:, columns[k]:columns[k+1]].all(axis=1)
+        const[k] = numpy.bincount(page_of[differs], minlength=n_pages) == 0
+
+    raw = []
+    for i in xrange(n_pages):
+        page = values[i*pagesize:(i+1)*pagesize]
+        for k in xrange(len(packing)):
+            block = page[:, columns[k]:columns[k+1]]
+            raw.append(block[0] if const[k, i] else block.ravel())
+    raw = numpy.concatenate(raw) if raw else values.ravel()
+
+    if not const.any():
+        return raw, None
+    constflags = [flags.tolist() if flags.any() else [] for flags in const]
+    return raw, constflags
+
+class Basis:
+    ''' Simple basis definition '''
+    def __init__(self, btype='NURBS', order=2,
+                    endinterpolation=True, knots=[0,0,1,1]):
+        self.Type = btype
+        self.Order = order
+        self.EndInterpolation = endinterpolation
+        self.Knots = knots
+
+    def load(self, bdata):
+        bdata = listToDict(bdata)
+        self.Type = bdata.get('type', self.Type)
+        self.Order = bdata.get('order', self.Order)
+        self.EndInterpolation = bdata.get('endinterpolation', self.EndInterpolation)
+        self.Knots = bdata.get('knots', self.Knots)
+
+    def save(self):
+        return [
+            "type", self.Type,
+            "order", self.Order,
+            "endinterpolation", self.EndInterpolation,
+            "knots", self.Knots
+        ]
+
+class TrimRegion:
+    ''' Class to define a trim region of a profile curve '''
+    def __init__(self):
+        ''' Create an empty trim region '''
+        self.OpenCasual = False
+        self.Faces = []
+
+    def load(self, tdata):
+        ''' Interpret the JSON schema to create a list of faces (with extents)
+            which define a single trim region '''
+        tdata = listToDict(tdata)
+        self.OpenCasual = tdata["opencasual"]
+        self.Faces = []
+        for face in tdata["faces"]:
+            fdata = listToDict(face)
+            self.Faces.append({
+                "face":fdata['face'],
+                "u0"  :fdata['u0'],
+                "u1"  :fdata['u1'],})
+
+    def save(self):
+        ''' Create an object reflecting the JSON schema for the trim region '''
+        data = [ "opencasual", self.OpenCasual ]
+        fdata = []
+        for f in self.Faces:
+            fdata.append([ "face", f["face"],
+                            "u0", f["u0"],
+                            "u1", f["u1"] ])
+        data += [ "faces", fdata ]
+        return data
+
+    
+
+def _unpackRLE(rle):
+    ''' Unpack a run-length encoded array of bit data (used to save groups) '''
+    runs = numpy.asarray(rle, dtype=numpy.int64).reshape(-1, 2)
+    return numpy.repeat(runs[:, 1].astype(bool), runs[:, 0])
+
+def _packRLE(bits):
+    ''' Run-length encode an array of bit data as [count, value, ...] '''
+    bits = numpy.asarray(bits, dtype=bool)
+    if not len(bits):
+        return []
+    starts = numpy.flatnonzero(bits[1:] != bits[:-1]) + 1
+    starts = numpy.concatenate(([0], starts))
+    counts = numpy.diff(numpy.append(starts, len(bits)))
+    rle = [None] * (2 * len(starts))
+    rle[0::2] = counts.tolist()
+    rle[1::2] = bits[starts].tolist()
+    return rle
+
+def _rleSize(rle):
+    ''' The length of a run-length encoding written as JSON text '''
+    counts = numpy.asarray(rle[0::2])
+    digits = numpy.floor(numpy.log10(counts)).astype(int) + 1
+    states = numpy.where(rle[1::2], 4, 5)    # true, false
+    return digits.sum() + states.sum() + 2 * (len(rle) - 1)
+
+class ElementGroup(object):
+    ''' There are different group types in GA.  ElementGroup's are used for
+        groups of primitive, vertex and point objects.  They may be ordered or
+        unordered.  A lazily loaded group decodes its selection on first use.
+    '''
+    def __init__(self, name):
+        ''' Create a new element group of the given name '''
+        self.Name = name
+        self._pending = None    # (unordered style, order, element count)
+        self.Selection = []
+        self.Order = None
+        self.Defaults = None
+        self.Count = 0
+
+    def _getSelection(self):
+        if self._pending is not None:
+            self.loadPending()
+        return self._selection
+
+    def _setSelection(self, selection):
+        self._selection = selection
+
+    def _getCount(self):
+        if self._pending is not None:
+            self.loadPending()
+        return self._count
+
+    def _setCount(self, count):
+        self._count = count
+
+    Selection = property(_getSelection, _setSelection)
+    Count = property(_getCount, _setCount)
+
+    def loadPending(self):
+        ''' Decode the selection of a lazily loaded group '''
+        style, order, element_count = self._pending
+        self._pending = None
+        if style:
+            self.loadUnordered(style)
+        else:
+            self.loadOrdered(order, element_count)
+        self.updateMembership()
+
+    def updateMembership(self):
+        ''' Count the number of elements in the group '''
+        self.Count = self.Selection.sum()
+
+    def loadUnordered(self, obj):
+        ''' Load an unordered group.  There are currently two encodings to
+        store the bit-array.  The runlengh encoding is an array of pairs
+        [count, value, count, value], while the "i8" encoding stores as 8-bit
+        integers (binary mode) '''
+        self.Selection = numpy.array([], dtype=bool)
+        obj = listToDict(obj)
+        rle = obj.get('boolRLE', None)
+        if rle is not None:
+            self.Selection = _unpackRLE(rle)
+            return
+        i8 = obj.get('i8', None)
+        if i8 is not None:
+            self.Selection = numpy.array(i8, dtype=bool)
+            return
+        _Assert(False, 'Unknown element group encoding')
+
+    def loadOrdered(self, obj, element_count):
+        ''' Ordered groups are stored as a list of the elements in the group
+        (in order) '''
+        self.Order = obj
+        self.Selection = numpy.zeros(element_count, dtype=bool)
+        self.Selection[numpy.asarray(obj, dtype=numpy.int64)] = True
+
+    def loadSelection(self, obj, element_count, lazy=False):
+        ''' Interpret the schema, loading the group selection '''
+        obj = listToDict(obj)
+        sel = listToDict(obj['selection'])
+        self.Defaults = sel['defaults']
+        style = sel.get('unordered', None)
+        if not style:
+            self.Order = sel['ordered']
+        self._pending = (style, self.Order, element_count)
+        if not lazy:
+            self.loadPending()
+    def save(self, gtype):
+        ''' Create the JSON schema for the group (definition & values).  An
+            unordered group is written run-length encoded (boolRLE) or as one
+            8-bit flag per element (i8), whichever is smaller. '''
+        gdef = [ "name", self.Name, "type", gtype ]
+        if self.Order:
+            selection = [
+                "defaults", self.Defaults,
+                "ordered", self.Order
+            ]
+        else:
+            rle = _packRLE(self.Selection)
+            if rle and _rleSize(rle) < 3 * len(self.Selection):
+                style = [ "boolRLE", rle ]
+            else:
+                style = [ "i8", numpy.asarray(self.Selection, dtype=numpy.int8) ]
+            selection = [
+                "defaults", self.Defaults,
+                "unordered", style
+            ]
+        return [ gdef, [ "selection", selection ] ]
+
+def savePoly(prim):
+    ''' Create the schema for the primitive '''
+    return [
+        "vertex", prim.Vertices,
+        "closed", prim.Closed
+    ]
+
+def saveMesh(prim):
+    ''' Create the schema for the primitive '''
+    return [
+        "vertex", prim.Vertices,
+        "surface", prim.Surface,
+        "uwrap", prim.Uwrap,
+        "vwrap", prim.Vwrap,
+    ]
+
+def saveMetaBall(prim):
+    ''' Create the schema for the primitive '''
+    return [
+        "vertex", prim.Vertices[0],
+        "transform", prim.Transform,
+        "metakernel", prim.Kernel,
+        "metaweight", prim.Weight
+    ]
+def saveMetaSQuad(prim):
+    ''' Create the schema for the primitive '''
+    return [
+        "vertex", prim.Vertices[0],
+        "transform", prim.Transform,
+        "metakernel", prim.Kernel,
+        "metaweight", prim.Weight,
+        "xy-exponent", prim.XYExponent,
+        "z-exponent", prim.ZExponent
+    ]
+def saveParticle(prim):
+    ''' Create the schema for the primitive '''
+    return [
+        "vertex", prim.Vertices,
+        "renderproperties", prim.RenderProperties,
+    ]
+
+def saveQuadric(prim):
+    ''' Create the schema for the primitive '''
+    return [
+        "vertex", prim.Vertices[0],
+        "transform", prim.Transform,
+    ]
+
+def saveTube(prim):
+    ''' Create the schema for the primitive '''
+    return [
+        "vertex", prim.Vertices[0],
+        "transform", prim.Transform,
+        "caps", prim.Caps,
+        "taper", prim.Taper,
+    ]
+
+def saveSplineCurve(prim):
+    ''' Create the schema for the primitive '''
+    return [
+        "vertex", prim.Vertices,
+        "closed", prim.Closed,
+        "basis", prim.Basis.save()
+    ]
+
+def saveSplineMesh(prim):
+    ''' Create the schema for the primitive '''
+    data = [
+        "vertex", prim.Vertices,
+        "surface", prim.Surface,
+        "uwrap", prim.Uwrap,
+        "vwrap", prim.Vwrap,
+        "ubasis", prim.UBasis.save(),
+        "vbasis", prim.VBasis.save()
+    ]
+    if hasattr(prim, 'Profiles'):
+        # Profiles are stored as a contained detail
+        data.append("profiles")
+        data.append(prim.Profiles.saveJSON())
+    return data
+
+def saveVolume(prim):
+    ''' Create the schema for the primitive '''
+    return [
+        "vertex", prim.Vertices[0],
+        "transform", prim.Transform,
+        "res", prim.Resolution,
+        "border", prim.Border,
+        "compression", prim.Compression,
+        "voxels", prim.Voxels
+    ]
+def saveUnknown(prim):
+    ''' Create the schema for an unknown primitive primitive.  This is simply
+        the primitive data loaded for an unknown primitive. '''
+    return prim.Data
+
+primSavers = {
+    'BezierCurve' : saveSplineCurve,
+    'BezierMesh'  : saveSplineMesh,
+    'Circle'      : saveQuadric,
+    'Mesh'        : saveMesh,
+    'MetaBall'    : saveMetaBall,
+    'MetaSQuad'   : saveMetaSQuad,
+    'NURBCurve'   : saveSplineCurve,
+    'NURBMesh'    : saveSplineMesh,
+    'Part'        : saveParticle,
+    'Poly'        : savePoly,
+    'Sphere'      : saveQuadric,
+    'Tube'        : saveTube,
+    'Volume'      : saveVolume,
+}
+
+class Primitive:
+    '''
+        A primitive represents a geometric primitive in a detail.  Every
+        primitive has a vertex list and may have other intrinsic attributes
+        (i.e. a closed flag for faces, a transform for quadrics, etc.).
+    '''
+    def __init__(self, prim_type, vertices=[]):
+        ''' Initialize the primitive of the given type.  All primitives have a
+        list of vertices '''
+        self.Type = prim_type
+        self.Vertices = vertices
+
+    def save(self):
+        ''' Call the appropriate save method to generate the schema for the
+        primitive. '''
+        return [
+            [ "type", self.Type ],
+            primSavers.get(self.Type, saveUnknown)(self)
+        ]
+
+    def getVertexCount(self):
+        ''' Return the number of vertices used by the primitive '''
+        return len(self.Vertices)
+    def getVertexOffset(self, vertex_index):
+        ''' Return vertex offset for the N'th vertex of the primitive '''
+        return self.Vertices[vertex_index]
+
+class PolyRunPrimitive(object):
+    ''' A single primitive of a PolyRun, viewing its part of the run '''
+    Type = 'Poly'
+
+    def __init__(self, run, index):
+        self.Run = run
+        self.Index = index
+
+    @property
+    def Vertices(self):
+        offsets = self.Run.Offsets
+        return self.Run.Indices[offsets[self.Index]:offsets[self.Index+1]]
+
+    @property
+    def Closed(self):
+        return self.Run.Closed
+
+    def save(self):
+        ''' Create the schema for the primitive on its own '''
+        return [ [ "type", self.Type ], savePoly(self) ]
+
+    def getVertexCount(self):
+        ''' Return the number of vertices used by the primitive '''
+        offsets = self.Run.Offsets
+        return int(offsets[self.Index+1] - offsets[self.Index])
+    def getVertexOffset(self, vertex_index):
+        ''' Return vertex offset for the N'th vertex of the primitive '''
+        return self.Run.Indices[self.Run.Offsets[self.Index] + vertex_index]
+
+class PolyRun(object):
+    '''
+        A run of Poly primitives which share a closed flag.  Rather than a
+        Primitive object each, the vertex lists are kept in one CSR layout:
+        Indices holds the vertex offsets of every primitive one after the
+        other, and primitive i uses Indices[Offsets[i]:Offsets[i+1]].
+        Indexing the run gives a PolyRunPrimitive view of one primitive.
+    '''
+    Type = 'Poly'
+
+    def __init__(self, indices=(), offsets=(0,), closed=True):
+        self.Indices = numpy.asarray(indices, dtype=numpy.int32)
+        self.Offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        self.Closed = closed
+
+    @classmethod
+    def fromVertexLists(cls, vertex_lists, closed=True):
+        ''' Build a run from a list of vertex lists '''
+        counts = numpy.fromiter((len(v) for v in vertex_lists), numpy.int64,
+                                len(vertex_lists))
+        offsets = numpy.concatenate(([0], numpy.cumsum(counts)))
+        if len(counts) and (counts == counts[0]).all():
+            indices = numpy.asarray(vertex_lists).reshape(-1)
+        else:
+            indices = numpy.concatenate([numpy.asarray(v) for v in vertex_lists] or [[]])
+        return cls(indices, offsets, closed)
+
+    def __len__(self):
+        return len(self.Offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('primitive index out of range')
+        return PolyRunPrimitive(self, index)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield PolyRunPrimitive(self, i)
+
+    def vertexCounts(self):
+        ''' Return the number of vertices of every primitive in the run '''
+        return numpy.diff(self.Offsets)
+
+    def save(self):
+        ''' Create the schema for the whole run as a single run block '''
+        pdef = [
+            "type", "run",
+            "runtype", self.Type,
+            "varyingfields", [ "vertex" ],
+            "uniformfields", { "closed" : self.Closed }
+        ]
+        counts = self.vertexCounts()
+        if len(counts) and (counts == counts[0]).all():
+            # every primitive has the same number of vertices
+            pdata = self.Indices.reshape(len(counts), 1, counts[0])
+        else:
+            pdata = [ [v] for v in numpy.split(self.Indices, self.Offsets[1:-1]) ]
+        return [ pdef, pdata ]
+
+def loadBasis(bdata):
+    ''' Create a Basis object from the schema '''
+    b = Basis()
+    b.load(bdata)
+    return b
+
+def loadPoly(ptype, pdata):
+    ''' Load the primitive from the schema '''
+    pdata = listToDict(pdata)
+    prim = Primitive('Poly', pdata['vertex'])
+    prim.Closed = pdata.get('closed', True)
+    return prim
+
+def loadMesh(ptype, pdata):
+    ''' Load the primitive from the schema '''
+    pdata = listToDict(pdata)
+    prim = Primitive('Mesh', pdata['vertex'])
+    prim.Surface = pdata['surface']
+    prim.Uwrap = pdata['uwrap']
+    prim.Vwrap = pdata['vwrap']
+    return prim
+
+def loadMetaBall(ptype, pdata):
+    ''' Load the primitive from the schema '''
+    pdata = listToDict(pdata)
+    prim = Primitive(ptype, [pdata['vertex']])
+    prim.Transform = pdata['transform']
+    prim.Kernel = pdata['metakernel']
+    prim.Weight = pdata['metaweight']
+    return prim
+def loadMetaSQuad(ptype, pdata):
+    ''' Load the primitive from the schema '''
+    pdata = listToDict(pdata)
+    prim = Primitive(ptype, [pdata['vertex']])
+    prim.Transform = pdata['transform']
+    prim.Kernel = pdata['metakernel']
+    prim.Weight = pdata['metaweight']
+    prim.XYExponent = pdata['xy-exponent']
+    prim.ZExponent = pdata['z-exponent']
+    return prim
+
+def loadQuadric(ptype, pdata):
+    ''' Load the primitive from the schema '''
+    pdata = listToDict(pdata)
+    prim = Primitive(ptype, [pdata['vertex']])
+    prim.Transform = pdata['transform']
+    return prim
+
+def loadTube(ptype, pdata):
+    ''' Load the primitive from the schema '''
+    pdata = listToDict(pdata)
+    prim = Primitive('Tube', [pdata['vertex']])
+    prim.Transform = pdata['transform']
+    prim.Caps = pdata.get('caps', False)
+    prim.Taper = pdata.get('taper', 1)
+    return prim
+
+def loadSplineCurve(ptype, pdata):
+    ''' Load the primitive from the schema '''
+    pdata = listToDict(pdata)
+    prim = Primitive(ptype, pdata['vertex'])
+    prim.Closed = pdata['closed']
+    prim.Basis = loadBasis(pdata['basis'])
+    return prim
+
+def loadSplineMesh(ptype, pdata):
+    ''' Load the primitive from the schema '''
+    pdata = listToDict(pdata)
+    prim = Primitive(ptype, pdata['vertex'])
+    prim.Surface = pdata['surface']
+    prim.Uwrap = pdata['uwrap']
+    prim.Vwrap = pdata['vwrap']
+    prim.UBasis = loadBasis(pdata['ubasis'])
+    prim.VBasis = loadBasis(pdata['vbasis'])
+    profiles = pdata.get('profiles', None)
+    if profiles:
+        # Detail is built on this module, so it can only be imported once it is needed
+        from HOU_Details_Class import Detail
+        prim.Profiles = Detail()
+        prim.Profiles.loadJSON(profiles)
+    return prim
+
+def loadParticle(ptype, pdata):
+    ''' Load the primitive from the schema '''
+    pdata = listToDict(pdata)
+    prim = Primitive(ptype, pdata['vertex'])
+    prim.RenderProperties = pdata.get('renderproperties', {})
+    return prim
+def loadVolume(ptype, pdata):
+    ''' Load the primitive from the schema '''
+    pdata = listToDict(pdata)
+    prim = Primitive(ptype, [pdata['vertex']])
+    prim.Transform = pdata['transform']
+    # Voxel resolution
+    prim.Resolution = pdata['res']
+    # Dictionary of border parameters
+    prim.Border = pdata['border']
+    # Dictionary of compression parameters
+    prim.Compression = pdata['compression']
+    # JSON encoding of UT_VoxelArray
+    prim.Voxels = pdata['voxels']
+    return prim
+def loadUnknown(ptype, pdata):
+    ''' Load the primitive from the schema '''
+    prim = Primitive(ptype, [])
+    prim.Data = pdata
+    return prim
+
+primLoaders = {
+    'BezierCurve'  : loadSplineCurve,
+    'BezierMesh'   : loadSplineMesh,
+    'Circle'       : loadQuadric,
+    'Mesh'        : loadMesh,
+    'MetaBall'    : loadMetaBall,
+    'MetaSQuad'    : loadMetaSQuad,
+    'NURBCurve'    : loadSplineCurve,
+    'NURBMesh'     : loadSplineMesh,
+    'Part'         : loadParticle,
+    'Poly'         : loadPoly,
+    'Sphere'       : loadQuadric,
+    'Tube'        : loadTube,
+    'Volume'       : loadVolume,
+
+    # Uncommon primitive types.  These are passed through verbatim currently
+    'MetaBezier'   : loadUnknown,
+    'MetaLine'     : loadUnknown,
+    'MetaTriangle' : loadUnknown,
+    'PasteSurf'    : loadUnknown,
+    'TriBezier'    : loadUnknown,
+    'TriFan'       : loadUnknown,
+    'TriStrip'     : loadUnknown,
+}
+
+def primRun(pdef, pdata):
+    ''' Load a run of primitives.  A run consists of a set of "uniform" fields
+        which have the same value for all primitives in the run as well as a
+        list of the varying fields (fields which have different values for the
+        primitives in the run).  Each primitive's data in the run has a simple
+        list of data which maps exactly (in size and order) to the list of
+        varying fields.  A run of polygons varying only in their vertices is
+        kept together as a single PolyRun.'''
+    # Load a run of primitives
+    ptype = pdef['runtype']
+    vfield = pdef['varyingfields']      # Values unique to each primitive
+    data = pdef['uniformfields']      # Values shared by all run primitives
+    if ptype == 'Poly' and list(vfield) == [ 'vertex' ]:
+        # Only the vertex lists vary, so keep the run together
+        return [ PolyRun.fromVertexLists([ v[0] for v in pdata ],
+                                         data.get('closed', True)) ]
+    primlist = []
+    for v in pdata:
+        vidx = 0
+        for field in vfield:
+            data[field] = v[vidx]
+            vidx += 1
+        primlist.append(primLoaders.get(ptype, loadUnknown)(ptype, data))
+    return primlist
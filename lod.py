@@ -0,0 +1,126 @@
+#! /usr/bin/env python2.6
+
+""" Levels of detail: thins out the points along branches before export.
+
+Every growth step is a point, so a long gently curving branch has many more points than a
+render needs. The tree is cut into branch polylines (treetopo.branchChains) and each one is
+simplified with Douglas-Peucker, for all branches at once: every round splits all the open
+segments of every branch at their farthest point, using whole-array numpy operations.
+
+One pass gives each point an importance, the largest tolerance at which Douglas-Peucker still
+keeps it. It is capped by the importance of the split above it, so the points kept at a
+tolerance are always a subset of those kept at a smaller one. A level of detail is then just
+importance > tolerance, and any number of levels come from the same pass. Branch ends and
+junctions have infinite importance and are always kept.
+
+The kept points are renumbered in order. Each one's parent becomes the nearest kept point
+towards the root, and the attributes describing the parent (parentPos, parentDir) and the
+link to it (dir) are recomputed.
+"""
+
+import numpy as np
+
+import treegeo
+import treetopo
+
+
+def _segmentDistances(points, a, b):
+    """ distance of each point to the segment from a to b, all (N,3) """
+    ab = b - a
+    length2 = (ab ** 2).sum(1)
+    t = ((points - a) * ab).sum(1) / np.where(length2 > 0, length2, 1.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.sqrt(((a + ab * t[:, None] - points) ** 2).sum(1))
+
+
+def importance(pos, parents):
+    """ the Douglas-Peucker importance of every point of a tree, see the module notes """
+    pos = np.asarray(pos, dtype=np.float64)
+    vertexMap, offsets = treetopo.branchChains(parents)
+    chainPos = pos[vertexMap]
+    weight = np.full(len(vertexMap), np.inf)
+    # the open segments: first and last vertex, and the importance of the split that made them
+    first = offsets[:-1]
+    last = offsets[1:] - 1
+    bound = np.full(len(first), np.inf)
+    while True:
+        inside = last - first > 1
+        first, last, bound = first[inside], last[inside], bound[inside]
+        if not len(first):
+            break
+        inner = last - first - 1
+        starts = np.cumsum(inner) - inner
+        segment = np.repeat(np.arange(len(first)), inner)
+        vertex = np.repeat(first + 1 - starts, inner) + np.arange(inner.sum())
+        dist = _segmentDistances(chainPos[vertex], chainPos[first[segment]], chainPos[last[segment]])
+        # the farthest vertex of each segment, the first one on ties
+        farthest = np.maximum.reduceat(dist, starts)
+        hit = np.flatnonzero(dist == farthest[segment])
+        hit = hit[np.concatenate(([True], segment[hit][1:] != segment[hit][:-1]))]
+        split = vertex[hit]
+        value = np.minimum(farthest, bound)
+        weight[split] = value
+        first, last, bound = (np.concatenate((first, split)), np.concatenate((split, last)),
+                              np.concatenate((value, value)))
+    # inner vertices are in one chain only; ends, shared between chains, stay infinite
+    out = np.full(len(pos), np.inf)
+    inner = np.ones(len(vertexMap), dtype=bool)
+    inner[offsets[:-1]] = False
+    inner[offsets[1:] - 1] = False
+    out[vertexMap[inner]] = weight[inner]
+    return out
+
+
+def _nearestKept(parents, keep):
+    """ the nearest kept point towards the root from every point, itself if it is kept """
+    up = np.where(keep, np.arange(len(parents)), parents)
+    # pointer jumping: each round doubles how far a pointer has climbed, so a run of d dropped
+    # points takes about log2(d) rounds
+    while True:
+        nxt = up[up]
+        if np.array_equal(nxt, up):
+            return up
+        up = nxt
+
+
+def simplify(cols, keep):
+    """ returns the point columns (a dict, like Tree.points.columns()) with only the points where
+        keep is True, renumbered, with parent links and parent attributes remapped """
+    parents = np.asarray(cols["parentId"])
+    keep = np.asarray(keep, dtype=bool)
+    rows = np.flatnonzero(keep)
+    newId = np.cumsum(keep) - 1
+    # the new parent is the nearest kept point above the old parent
+    kept = _nearestKept(parents, keep)
+    parent = kept[parents[rows]]
+    out = {}
+    for name, col in cols.items():
+        out[name] = np.asarray(col)[rows]
+    pos = np.asarray(cols["pos"])
+    isRoot = parents[rows] == rows
+    out["id"] = np.arange(len(rows), dtype=out["id"].dtype)
+    out["parentId"] = np.where(isRoot, out["id"], newId[parent])
+    out["parentPos"] = np.where(isRoot[:, None], out["parentPos"], pos[parent])
+    # a point's parentDir is its parent's dir, so it comes from the new dirs
+    out["dir"] = np.where(isRoot[:, None], out["dir"], out["pos"] - pos[parent])
+    out["parentDir"] = np.where(isRoot[:, None], out["parentDir"], out["dir"][out["parentId"]])
+    return out
+
+
+def levels(source, tolerances):
+    """ returns one dict of point columns per tolerance, from a Tree, its PointStore or a dict of
+        columns. Importance is worked out once for all of them. """
+    cols, attList = treegeo._columns(source)
+    cols = dict((name, np.asarray(col)) for name, col in cols.items())
+    weight = importance(cols["pos"], cols["parentId"])
+    return [simplify(cols, weight > tol) for tol in tolerances]
+
+
+def saveLODs(source, filename, tolerances, schemaFile="control.txt", pagesize=treegeo.hgeo.PAGESIZE):
+    """ writes one .geo (or .bgeo) per tolerance. filename holds a %d for the level number, e.g.
+        "tree_lod%d.bgeo". Returns the file names. """
+    names = []
+    for level, cols in enumerate(levels(source, tolerances)):
+        names.append(filename % level)
+        treegeo.saveTreeGeo(cols, names[-1], schemaFile, pagesize=pagesize)
+    return names
@@ -0,0 +1,100 @@
+#! /usr/bin/env python2.6
+
+""" Columnar point storage for runtree.Tree.
+
+Every attribute lives in its own preallocated numpy column, so a tree of N points costs
+N rows per column instead of N python lists. Vector attributes (pos, dir, ...) are (N,3)
+float columns, counters and ids are int64 columns. The columns grow by doubling.
+"""
+
+import numpy as np
+
+
+class PointStore(object):
+    """ structure-of-arrays store. schema is a list of (name, dtype, width, default) """
+
+    def __init__(self, schema, capacity=1024):
+        self.schema = list(schema)
+        self.names = [s[0] for s in self.schema]
+        self.index = {}
+        self.widths = {}
+        self.defaults = {}
+        self.cols = {}
+        self.count = 0
+        self.capacity = max(int(capacity), 1)
+        for i, (name, dtype, width, default) in enumerate(self.schema):
+            self.index[name] = i
+            self.widths[name] = width
+            self.defaults[name] = default
+            shape = (self.capacity,) if width == 1 else (self.capacity, width)
+            self.cols[name] = np.empty(shape, dtype=dtype)
+
+    def __len__(self):
+        return self.count
+
+    def reserve(self, capacity):
+        """ makes room for at least capacity rows, doubling to keep appends amortized """
+        if capacity <= self.capacity:
+            return
+        newCap = self.capacity
+        while newCap < capacity:
+            newCap *= 2
+        for name in self.names:
+            old = self.cols[name]
+            col = np.empty((newCap,) + old.shape[1:], dtype=old.dtype)
+            col[:self.count] = old[:self.count]
+            self.cols[name] = col
+        self.capacity = newCap
+
+    def add(self, num=1):
+        """ appends num rows set to their defaults, returns the id of the first new row.
+            The 'id' column, if present, is set to the row index."""
+        start = self.count
+        end = start + num
+        self.reserve(end)
+        for name in self.names:
+            self.cols[name][start:end] = self.defaults[name]
+        if "id" in self.cols:
+            self.cols["id"][start:end] = np.arange(start, end)
+        self.count = end
+        return start
+
+    def column(self, name):
+        """ returns a writable view of the live rows of a column """
+        return self.cols[name][:self.count]
+
+    def columns(self):
+        """ returns a dict of every live column, by name """
+        out = {}
+        for name in self.names:
+            out[name] = self.column(name)
+        return out
+
+    def set(self, point, name, value):
+        if point >= self.count:
+            raise IndexError("point %d out of range" % point)
+        self.cols[name][point] = value
+
+    def get(self, point, name):
+        """ returns a python value: a tuple for vector attributes, a scalar otherwise """
+        if point >= self.count:
+            raise IndexError("point %d out of range" % point)
+        value = self.cols[name][point]
+        if self.widths[name] == 1:
+            return value.item()
+        return tuple(value.tolist())
+
+    def row(self, point):
+        """ returns one point as the old list of attribute values, in schema order """
+        return [self.get(point, name) for name in self.names]
+
+    def rows(self):
+        """ returns every point as a list of lists (the old Tree.allPoints layout) """
+        lists = []
+        for name in self.names:
+            col = self.column(name)
+            if self.widths[name] == 1:
+                lists.append(col.tolist())
+            else:
+                lists.append([tuple(v) for v in col.tolist()])
+        return [list(r) for r in zip(*lists)]
@@ -16,11 +16,17 @@ The index will be the id
 """
 
 #! /usr/bin/env python2.6
+import os
+import glob
+import json
+import hashlib
 import  math 
-import random
 import numpy as np
-import treeMath as tm
-import cPickle as pickle
+import treemath as tm
+import treerand
+from pointstore import PointStore
+import spatial
+import treeio
 import shelve
 import thread
 
@@ -37,35 +43,60 @@ def fit(value=.33,inMin=0.0,inMax=1.0,outMin=0.0,outMax=100.0):
 #============================CONTROL CLASS ===========================
 #=====================================================================
 
+# control parameters in control.txt order, with their types
+PARMS = [
+    ("seed", float),
+    ("stepNum", int),
+    ("stepSize", float),
+    ("stepRange", float),
+    ("jitAngleRange", float),
+    ("branchAngle", float),
+    ("branchAngleRange", float),
+    ("maxPoints", int),
+    ]
+
 class Control(object):
     """ reads parameters from a file and stores parameters used to drive the tree creation program"""
    
-    def __init__(self,filename = "control.txt"):
-        """d = locals()
-        e = len(d)
-        if e != 2:
-            raise ValueError("requires string object of path to control file")
-        print e
-        print d.values()"""
+    def __init__(self,filename = "control.txt", **overrides):
+        """ reads the first len(PARMS) lines of filename, then applies any overrides given by
+        parameter name, e.g. Control("control.txt", seed=2.0). With filename None nothing is read
+        and only the overrides are set."""
         self.parms = []
-        with open(filename) as file:
-            data = file.readlines()
-            count = 0
-            for line in data:
-                if count == 7:
-                    break
-                val = line.split()
-                tmp = val[2]
-                self.parms.append(tmp)
-                count += 1
-        self.__class__.seed = float(self.parms[0])
-        self.__class__.stepNum = int(self.parms[1])
-        self.__class__.stepSize = float(self.parms[2])
-        self.__class__.stepRange = float(self.parms[3])
-        self.__class__.jitAngleRange = float(self.parms[4])
-        self.__class__.branchAngle = float(self.parms[5])
-        self.__class__.branchAngleRange = float(self.parms[6])
-        self.__class__.maxPoints = int(self.parms[7])
+        if filename is not None:
+            with open(filename) as file:
+                data = file.readlines()
+                count = 0
+                for line in data:
+                    if count == len(PARMS):
+                        break
+                    val = line.split()
+                    tmp = val[2]
+                    self.parms.append(tmp)
+                    count += 1
+            self.update(**dict(zip([p[0] for p in PARMS], self.parms)))
+        self.update(**overrides)
+
+    def update(self, **parms):
+        """ sets parameters by name. They are kept on this instance and on the class, which is
+        what the Tree reads while it grows."""
+        kinds = dict(PARMS)
+        for name, value in parms.items():
+            if name not in kinds:
+                raise ValueError("unknown control parameter " + name)
+            setattr(self, name, kinds[name](value))
+            setattr(self.__class__, name, kinds[name](value))
+
+    def apply(self):
+        """ makes this instance's parameters the current class parameters again """
+        self.update(**self.values())
+
+    def values(self):
+        """ returns the parameters as a dict, enough to rebuild this Control with Control(None, **values) """
+        out = {}
+        for name, kind in PARMS:
+            out[name] = getattr(self, name)
+        return out
 
     def status(self):
         list =  "seed = "+str(self.__class__.seed)+"\n"\
@@ -81,6 +112,70 @@ class Control(object):
 #----------------------------END CONTROL CLASS ---------------------------
 #-------------------------------------------------------------------------
         
+#-------------------------- POINT ATTRIBUTES ---------------------------
+# name, numpy dtype, width, default. The order is the old allPoints list order (attList).
+POINT_SCHEMA = [
+    ("id",         "int64",   1, 0),
+    ("pos",        "float64", 3, (0.0,0.0,0.0)),
+    ("line",       "int64",   1, 0),
+    ("parentId",   "int64",   1, 0),
+    ("parentPos",  "float64", 3, (0.0,0.0,0.0)),
+    ("parentLine", "int64",   1, 0),
+    ("angle",      "float64", 1, 30.0),
+    ("dir",        "float64", 3, (0.0,1.0,0.0)),
+    ("walk",       "float64", 1, 0.0),
+    ("birthStep",  "int64",   1, 0),
+    ("alive",      "int64",   1, 1),
+    ("split",      "int64",   1, 2),
+    ("parentDir",  "float64", 3, (0.0,1.0,0.0)),
+    ("key",        "uint64",  1, treerand.ROOT_KEY),  # structural key that seeds the point's random numbers
+    ]
+
+# the only columns growth reads from parents; streamTree keeps just these for the growth front
+FRONT_COLUMNS = ("pos", "dir", "angle", "key", "split")
+# front points streamTree grows from at once
+STREAM_ROWS = 1 << 16
+
+#-------------------------- CHECKPOINTS ---------------------------
+# the parameters every generation depends on. Checkpoints are only shared by runs where they agree;
+# stepNum and maxPoints only decide where growth stops.
+GROWTH_PARMS = ("seed", "stepSize", "stepRange", "jitAngleRange", "branchAngle", "branchAngleRange")
+
+def growthKey(control):
+    """ a short hash of the GROWTH_PARMS values of a Control, used in checkpoint names """
+    values = [[name, getattr(control, name)] for name in GROWTH_PARMS]
+    return hashlib.sha1(json.dumps(values)).hexdigest()[:12]
+
+def checkpointName(dirname, control, step):
+    return os.path.join(dirname, "step_%04d_%s.tree" % (step, growthKey(control)))
+
+def _checkpointDue(step, checkpointAt, last):
+    if checkpointAt is None:
+        return step == last
+    if isinstance(checkpointAt, (int, long)):
+        return step % checkpointAt == 0
+    return step in checkpointAt
+
+def _resumable(header, control, limit):
+    """ True when the checkpoint with this header is on the way of a run with control, up to step limit """
+    saved = header.get("control")
+    if not saved or header.get("count") is None or header.get("currentStep") is None:
+        return False
+    if [e["name"] for e in header["columns"]] != [s[0] for s in POINT_SCHEMA]:
+        return False
+    for name in GROWTH_PARMS:
+        if dict(PARMS)[name](saved[name]) != getattr(control, name):
+            return False
+    if header["currentStep"] > limit:
+        return False
+    # when maxPoints stopped either run by then, their trees may differ from there on
+    count = header["count"]
+    if count > control.maxPoints:
+        return False
+    if count >= saved["maxPoints"] and saved["maxPoints"] != control.maxPoints:
+        return False
+    return True
+
 #+++++++++++++++++++++++++++++++Main Class++++++++++++++++++++++++++++++++++++
 #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++        
 class Tree(object):
@@ -89,20 +184,20 @@ class Tree(object):
 
     def __init__(self):   
         """ 
-        1. calls the attribute function to return a list of values
-        2. adds that list as an element of an array to allPoints.
+        1. creates the columnar point store, one numpy column per attribute (see POINT_SCHEMA)
+        2. adds the root point to it.
             The id is the index of the item
         3. Sets the global TOTAL attribute to 0
 
         """
         self.TOTAL = 0
         self.currentStep = 0
-        self.allPoints = []
-        bundle = self.attributes()
-        self.allPoints.append(bundle) # this attaches the root point, as represented by the bundle list of attributes
-        self.attList = {"id" : 0,"pos" : 1,"line" : 2, "parentId" : 3, "parentPos" : 4,"parentLine" : 5,\
-               "angle" : 6 ,"dir" : 7, "walk" : 8, "birthStep" : 9, "alive" : 10 , "split" : 11,\
-               "parentDir" : 12}          
+        self.rng = None
+        self.control = None
+        self.spatial = None
+        self.points = PointStore(POINT_SCHEMA)
+        self.points.add() # this attaches the root point, with every attribute at its default
+        self.attList = dict(self.points.index)
 #-----------------------Global Attributes to conform to bgeo formatting code--------------------------------
         self.PointAttributes = {}
         self.PrimitiveAttributes = {}
@@ -121,107 +216,271 @@ class Tree(object):
         local_options = {}
         self.define["options"] ={}
   
-    def addPoint(self,parent = 0):
+    def addPoint(self,parent = 0, sibling = 0):
         """ this function:
         1. increments the index, 
-        2. gets a bundle of attributes,
-        3. and assigns it to an array. 
-        4. It records the calling point as attribute parentId.
+        2. appends a row of default attributes to the point store,
+        3. It records the calling point as attribute parentId.
+        4. It keys the point from its parent's key and its sibling number (see treerand)
         5. It also returns the index of the new element as 'thisId' """        
-        self.TOTAL += 1
-        bundle = self.attributes()
-        thisId = self.TOTAL
-        self.allPoints.append(bundle) 
+        thisId = self.points.add()
+        self.TOTAL = thisId
         # set inherited attributes
         self.setAttr(thisId,"parentId",parent)
+        parentKey = self.points.column("key")[parent]
+        self.setAttr(thisId,"key",treerand.childKeys([parentKey],[sibling])[0])
         return thisId
         
-        #print bundle
-        
     def setAttr(self, point, attName, value):
-        index = int(self.attList[attName])
-        self.allPoints[point][index] = value 
+        self.points.set(point, attName, value)
         
     def getAttr(self, point, attName):
-        index = int(self.attList.get(attName,100))
-        tmp = self.allPoints[point][index] 
-        return tmp
+        return self.points.get(point, attName)
+
+    @property
+    def allPoints(self):
+        """ legacy list-of-lists view of the point store. This is a copy, so it is slow for big trees
+            and writing to it does not change the tree. Use self.points for real work."""
+        return self.points.rows()
         
     def attributes(self):
-        pid = self.TOTAL
-        pos = (0.0,0.0,0.0)
-        line = 0
-        parentId = 0
-        parentPos = (0.0,0.0,0.0)
-        parentLine = 0
-        angle = 30.0
-        dirv = (0,1.0,0)
-        walk = 0.0
-        birthStep = 0
-        alive = 1
-        split = 2
-        parentDir = (0.0,1.0,0.0)
-        bundle = [pid,pos,line,parentId,parentPos,parentLine,angle,dirv,walk,birthStep,alive,split,parentDir]
+        """ returns the default attribute bundle for a new point, in attList order """
+        bundle = [s[3] for s in POINT_SCHEMA]
+        bundle[0] = self.TOTAL
         return bundle
         
-    def makeTree(self):
+    def makeTree(self, batched=True, control=None, steps=None, sink=None, colonizer=None,
+                 checkpoints=None, checkpointAt=None):
         """
-        1. Calls the Control function to read global control values from a file
+        1. Calls the Control function to read global control values from a file, unless a Control is given
         2. Starts a loop limited by number of steps allowed. (steps equal length of longest line)
-            3. this loop first gets the current number of existing points
-            4. It loops over this entire range
+           It runs from self.currentStep up to Control.stepNum, or only up to steps when given,
+           so calling makeTree again carries on where the last call stopped.
+            3. with batched on (the default) each step is one call to growGeneration,
+               which grows every child of the generation with whole-column numpy operations.
+            4. otherwise it loops over every existing point
                 5. It grabs a point and pulls out the split attribute value [0-x]
                     6. It starts a range loop over value of split
                         7. Each iteration, it adds a point
                         8. Then gets the id
                         9. Then resets the attributes to new values
-        10. For testing only, it then loops through all points a prints some values       
+        Both ways give the same points in the same order, and stop adding points at Control.maxPoints.
+        With a sink, growth is handed to streamTree instead, which writes generations out as it goes.
+        With a colonizer (a colonize.Colonizer) every step grows the tree towards its attractors
+        instead of taking random steps.
+        With checkpoints, a directory, a new tree first resumes from the latest checkpoint there that
+        grows the same tree (see resume), and the tree is saved there after the generations in
+        checkpointAt: a list of steps, or a number to save every that many steps. By default only the
+        last step grown is saved.
         """
-        Control("control.txt")
+        if sink is not None:
+            if colonizer is not None:
+                raise ValueError("space colonization needs the whole tree, it cannot stream to a sink")
+            return self.streamTree(sink, control)
+        if control is None:
+            control = Control("control.txt")
+        control.apply()
+        self.control = control
+        self.rng = treerand.CounterRNG(Control.seed)
         parentId = 0 
-        while (self.currentStep < Control.stepNum):
-            allP = len(self.allPoints) 
+        if steps is None:
+            steps = Control.stepNum
+        if checkpoints is not None:
+            if colonizer is not None:
+                raise ValueError("space colonization growth can not be checkpointed")
+            if isinstance(checkpointAt, (int, long)) and checkpointAt <= 0:
+                raise ValueError("checkpointAt must be a positive number of steps, not %d" % checkpointAt)
+            if self.currentStep == 0:
+                self.resume(checkpoints, control, steps)
+        while (self.currentStep < min(steps, Control.stepNum)):
+            allP = len(self.points) 
             print "number of points = " + str(allP)
-            
-            for p in range(allP):   
-                    thisPoint = self.allPoints[p]
-                    localSplit = self.getAttr(p, "split")
-                    for d in range(localSplit):
-                        self.addPoint(p)  #adds a point with parent point in argument
-                        thisId = self.TOTAL
-                        self.setPoint(thisId)
-                    self.setAttr(p, "split", 0)
-                    
-            self.currentStep += 1
+            if colonizer is not None:
+                colonizer.grow(self)
+            elif batched:
+                self.growGeneration()
+            else:
+                for p in range(allP):   
+                        localSplit = self.getAttr(p, "split")
+                        for d in range(localSplit):
+                            if len(self.points) >= Control.maxPoints:
+                                break
+                            self.addPoint(p, d)  #adds a point with parent point in argument
+                            thisId = self.TOTAL
+                            self.setPoint(thisId)
+                        self.setAttr(p, "split", 0)
+                        
+                self.currentStep += 1
+            if checkpoints is not None and _checkpointDue(self.currentStep, checkpointAt, min(steps, Control.stepNum)):
+                self.saveCheckpoint(checkpoints)
         #return self.allPoints
+
+    def growGeneration(self):
+        """ grows one step for the whole tree at once. Every point with split > 0 gets split children,
+            children are numbered parent by parent exactly like the scalar loop in makeTree.
+            Returns the ids of the new points."""
+        store = self.points
+        front = {}
+        for name in FRONT_COLUMNS:
+            front[name] = store.column(name)
+        kids = self._spawn(front, 0, len(store))
+        num = len(kids["id"])
+        if num:
+            first = store.add(num)
+            for name in store.names:
+                store.column(name)[first:] = kids[name]
+            self.TOTAL = first + num - 1
+            if self.spatial is not None:
+                self.spatialIndex()
+        self.currentStep += 1
+        return kids["id"]
+
+    def addChildren(self, parents, positions, siblings):
+        """ appends one new point per parent, at the given (N,3) positions, and returns their ids. The
+            children inherit angle and get their parent links, direction and birthStep like grown points;
+            their split is 0 so random growth leaves them alone. siblings numbers each child among its
+            parent's children, which keys its random numbers (see treerand)."""
+        store = self.points
+        parents = np.asarray(parents, dtype=np.int64)
+        num = len(parents)
+        first = store.add(num)
+        if num:
+            cols = store.columns()
+            parentPos = cols["pos"][parents]
+            cols["parentId"][first:] = parents
+            cols["parentPos"][first:] = parentPos
+            cols["parentDir"][first:] = cols["dir"][parents]
+            cols["angle"][first:] = cols["angle"][parents]
+            cols["key"][first:] = treerand.childKeys(cols["key"][parents], siblings)
+            cols["birthStep"][first:] = self.currentStep + 1
+            cols["split"][first:] = 0
+            cols["pos"][first:] = positions
+            cols["dir"][first:] = positions - parentPos
+            self.TOTAL = first + num - 1
+            if self.spatial is not None:
+                self.spatialIndex()
+        return np.arange(first, first + num)
+
+    def spatialIndex(self, cellSize=None):
+        """ returns a spatial.SpatialHash over the point positions, brought up to date with any points
+            added since the last call. It is made on the first call, with cells of cellSize (half of
+            Control.stepSize by default); from then on growGeneration inserts each new generation."""
+        if self.spatial is None:
+            self.spatial = spatial.SpatialHash(cellSize or 0.5 * Control.stepSize)
+        done = len(self.spatial)
+        if done < len(self.points):
+            self.spatial.insert(self.points.column("pos")[done:])
+        return self.spatial
+
+    def _spawn(self, front, firstId, total):
+        """ makes one generation of children from the growth front. front holds the FRONT_COLUMNS
+            of the front points, whose ids start at firstId; their split is zeroed in place. total
+            is the number of points in the tree so far. Returns every POINT_SCHEMA column of the children."""
+        split = front["split"]
+        parents = np.flatnonzero(split > 0)
+        counts = split[parents]
+        rows = np.repeat(parents, counts)
+        siblings = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        room = max(Control.maxPoints - total, 0)
+        if len(rows) > room:
+            rows = rows[:room]
+            siblings = siblings[:room]
+        split[parents] = 0
+        num = len(rows)
+        kids = {}
+        for name, dtype, width, default in POINT_SCHEMA:
+            kids[name] = np.empty((num,) if width == 1 else (num, width), dtype=dtype)
+            kids[name][:] = default
+        parentPos = front["pos"][rows]
+        parentDir = front["dir"][rows]
+        kids["id"][:] = np.arange(total, total + num)
+        kids["parentId"][:] = rows + firstId
+        kids["parentPos"][:] = parentPos
+        kids["parentDir"][:] = parentDir
+        kids["angle"][:] = front["angle"][rows]
+        kids["key"][:] = treerand.childKeys(front["key"][rows], siblings)
+        kids["birthStep"][:] = self.currentStep + 1
+        if num:
+            step = self.makeSteps(parentDir, kids["key"])
+            position = parentPos + step
+            kids["pos"][:] = position
+            kids["dir"][:] = position - parentPos
+        return kids
+
+    def streamTree(self, sink, control=None):
+        """ grows like makeTree, but hands every generation to sink (a treeio.GenerationSink) as soon as
+            it is done. The growth front is spooled to temporary files with only its FRONT_COLUMNS and
+            grown STREAM_ROWS points at a time; the other columns of new points go straight out, so
+            memory stays flat however large the tree gets. The points already in the tree are written
+            first. Afterwards self.points is empty, TOTAL and currentStep describe the streamed tree,
+            and the number of points written is returned. The caller closes the sink."""
+        if control is None:
+            control = Control("control.txt")
+        control.apply()
+        self.control = control
+        self.rng = treerand.CounterRNG(Control.seed)
+        store = self.points
+        cols = store.columns()
+        live = np.flatnonzero(cols["split"] > 0)
+        firstFront = live[0] if len(live) else len(store)
+        if len(live) != len(store) - firstFront:
+            raise ValueError("streamTree needs the growth front at the end of the point store")
+        frontSchema = [s for s in POINT_SCHEMA if s[0] in FRONT_COLUMNS]
+        sink.write(dict((name, cols[name][:firstFront]) for name in store.names))
+        sink.write(dict((name, cols[name][firstFront:]) for name in store.names if name not in FRONT_COLUMNS))
+        front = treeio.ColumnSpool(frontSchema)
+        front.write(dict((name, cols[name][firstFront:]) for name in FRONT_COLUMNS))
+        total = len(store)
+        store = cols = None
+        self.points = PointStore(POINT_SCHEMA, capacity=1)
+        while (self.currentStep < Control.stepNum):
+            print "number of points = " + str(total)
+            nextFront = treeio.ColumnSpool(frontSchema)
+            parentId = firstFront
+            for chunk in front.chunks(STREAM_ROWS):
+                # children are numbered in parent order, so chunk by chunk they get the same ids
+                kids = self._spawn(chunk, parentId, total + len(nextFront))
+                sink.write(chunk)
+                sink.write(dict((name, kids[name]) for name in kids if name not in FRONT_COLUMNS))
+                nextFront.write(kids)
+                parentId += len(chunk["split"])
+            front = nextFront
+            firstFront = total
+            total += len(nextFront)
+            self.currentStep += 1
+        for chunk in front.chunks(STREAM_ROWS):
+            sink.write(chunk)
+        self.TOTAL = total - 1
+        return total
             
     def printTree(self):    
-        plist = self.allPoints
-        v = []
-        for p in plist:
-            x = p[0]
-            v.append(x)
+        v = self.points.column("id").tolist()
         print v
-        print len(plist)
+        print len(v)
                                   
-    def makeStep(self,dir=(0.0,1.0,0),seed = 1.2):  #this works but needs to return a position vector
-        """called with the parentDir as the first argument and id as the second, returns a position dir """
+    def makeStep(self,dir=(0.0,1.0,0),key = 0):
+        """called with the parentDir as the first argument and the new point's key as the second, returns a step vector """
         dist = Control.stepSize
         var = Control.stepRange * .5
-        random.seed(Control.seed+seed)
-        wander = random.random()
+        wander = self.rng.uniform([key], treerand.PURPOSE_STEP)[0,0]
         steplength = fit(wander,0,1,dist-var,dist+var)
-        dvec = self.dirVec(dir,seed)
-        #newStep = tm.vecMult(dvec, steplength)
-        newStep = dvec  #remove when math library added*********************************************************
-        ##addWalk goes here        
+        dvec = self.dirVec(dir,key)
+        newStep = tm.vecMult(dvec, steplength)
+        ##addWalk goes here
         return newStep
-        
+
+    def makeSteps(self, parentDirs, keys):
+        """ batched makeStep: one row of parentDirs per new point key, returns an (N,3) array of steps """
+        dist = Control.stepSize
+        var = Control.stepRange * .5
+        wander = self.rng.uniform(keys, treerand.PURPOSE_STEP)[:,0]
+        steplength = fit(wander,0,1,dist-var,dist+var)
+        dvec = self.dirVecs(parentDirs, keys)
+        return tm.batchMult(dvec, steplength)
+
     def setPoint(self,thisId=1):
         """retrieve Point objects. Requires control attributes"""
-        localPoint = self.allPoints[thisId]
-        parentId = localPoint[3]
-        localParent = self.allPoints[parentId]
+        parentId = self.getAttr(thisId,"parentId")
         #inheritable attributes
         parentPos = self.getAttr(parentId,"pos")
         parentDir = self.getAttr(parentId,"dir")
@@ -229,10 +488,12 @@ class Tree(object):
         self.setAttr(thisId,"parentPos",parentPos)
         self.setAttr(thisId, "parentDir",parentDir)
         self.setAttr(thisId, "angle",angle)
-        step = self.makeStep(parentDir, parentId)
+        step = self.makeStep(parentDir, self.points.column("key")[thisId])
         position = tm.vecAdd(step,parentPos)
         tmpVec = tm.vecSub(parentPos,position)
+        self.setAttr(thisId,"pos",position)
         self.setAttr(thisId,"dir",tmpVec)
+        self.setAttr(thisId,"birthStep",self.currentStep + 1)
            
     
     def __str__(self):
@@ -248,56 +509,102 @@ class Tree(object):
               "birthStep = " + str(self.birthStep)
         return rep
     
-    def randVec(self,seed = 1.3):
-        """TESTED  requires loading random module, returns normalized vector. TESTED """
-        thisSeed = seed * self.TOTAL
-        random.seed(thisSeed)
-        a = random.random()-.5
-        b = random.random()-.5
-        c = random.random()-.5
-        outVec = (a,b,c)
-        newVec = tm.vecNorm(outVec)
-        return newVec
+    def randVec(self,key = 0):
+        """returns a normalized random vector for the point key, from the tree's counter based rng"""
+        return tuple(self.randVecs([key])[0].tolist())
 
-    def dirVec(self,parentDir=(0.0,1.0,0.0),parentId=0,upVec = (0.0,1.0)):
-        """calls parentVec, randomVec, and blends them using angleJitter. The makeStep functions multiplies this by steplength to return product"""
-        randir = self.randVec(parentId)
-        #pdir = tm.vecNorm(parentDir)
-        pdir = parentDir#remove when math library added*********************************************************
+    def randVecs(self, keys):
+        """ batched randVec, one normalized vector per point key """
+        return self.rng.unitVectors(keys, treerand.PURPOSE_DIR)
+
+    def dirVec(self,parentDir=(0.0,1.0,0.0),key=0,upVec = (0.0,1.0)):
+        """turns parentDir towards a random vector by jitAngleRange of the angle between them, at most
+        branchAngle degrees. The makeStep functions multiplies this by steplength to return product"""
+        randir = self.randVec(key)
         mix = Control.jitAngleRange
-        #newVec = tm.vecBlend(pdir, randir, mix)
-        newVec = randir  #remove when math library added*********************************************************
+        newVec = tm.vecSlerp(parentDir, randir, mix, math.radians(Control.branchAngle))
         return newVec
 
+    def dirVecs(self, parentDirs, keys):
+        """ batched dirVec """
+        randir = self.randVecs(keys)
+        mix = Control.jitAngleRange
+        return tm.batchSlerp(parentDirs, randir, mix, math.radians(Control.branchAngle))
+
 #------------------------------------WRITE OUT ---------------------------------------
 
     def saveFile(self, filename):
-        """writes out pickled data. Data is the self.allPoints attribute of the Tree instance."""
-        myData = self.allPoints
-        header = self.attList
-        dataOut = [header, myData]
-        output = open(filename,"wb")
-        pickle.dump(dataOut, output)
-        output.close()
+        """writes the point columns to filename in the treeio container format, with the Control the
+        tree was grown with. Files from the old cPickle saveFile convert with treeio.convertPickle."""
+        extra = {"attList": self.attList, "TOTAL": int(self.TOTAL), "currentStep": self.currentStep}
+        if self.rng is not None:
+            extra["rngSeed"] = self.rng.seed
+        treeio.saveColumns(filename, self.points.columns(), POINT_SCHEMA, self.control, extra)
+
+    def loadFile(self, filename):
+        """reads a file written by saveFile back into this tree: its points, TOTAL, currentStep and
+        Control. Returns the file's header."""
+        header, cols = treeio.loadColumns(filename)
+        names = [e["name"] for e in header["columns"]]
+        if names != [s[0] for s in POINT_SCHEMA]:
+            raise ValueError("%s does not hold the tree point columns" % filename)
+        store = PointStore(POINT_SCHEMA, capacity=header["count"])
+        store.add(header["count"])
+        for name in store.names:
+            store.column(name)[:] = cols[name]
+        self.points = store
+        self.spatial = None
+        self.TOTAL = header["TOTAL"]
+        self.currentStep = header["currentStep"]
+        if header.get("control"):
+            self.control = Control(None, **header["control"])
+            self.rng = treerand.CounterRNG(header.get("rngSeed", self.control.seed))
+        return header
+
+    def saveCheckpoint(self, dirname):
+        """saves the tree in dirname as the checkpoint of its current step. Returns the file name."""
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        filename = checkpointName(dirname, self.control, self.currentStep)
+        self.saveFile(filename)
+        return filename
+
+    def resume(self, dirname, control, steps=None):
+        """loads the latest checkpoint in dirname that a run with control would have passed through,
+        going no further than steps (Control.stepNum by default). A checkpoint qualifies when every
+        GROWTH_PARMS value matches, its step is within reach, and maxPoints cut neither that run nor
+        this one short by then: later generations may have changed, earlier ones have not.
+        Returns the step resumed from, or None when there is no such checkpoint."""
+        limit = min(steps if steps is not None else control.stepNum, control.stepNum)
+        found = []
+        for filename in glob.glob(os.path.join(dirname, "step_*_%s.tree" % growthKey(control))):
+            with open(filename, "rb") as fp:
+                header = treeio.readHeader(fp)
+            if _resumable(header, control, limit):
+                found.append((header["currentStep"], filename))
+        if not found:
+            return None
+        step, filename = max(found)
+        self.loadFile(filename)
+        # the checkpoint's own Control may have differed in later parameters
+        control.apply()
+        self.control = control
+        self.rng = treerand.CounterRNG(control.seed)
+        return step
     
     
 #------------------------Utility Functions ------------------------
 
 #main
 
-tree = Tree()
-#myData = tree.makeTree()
-tree.makeTree()
-tree.saveFile("saveData.p")
-
-#output = open("saveData.p","wb")
-
-#output.close()
-
-loadFile = pickle.load(open("saveData.p","rb"))
-print loadFile[0]
-print loadFile[1]
-pp = Control("control.txt")
-print pp.parms
-
+if __name__ == "__main__":
+    tree = Tree()
+    #myData = tree.makeTree()
+    tree.makeTree()
+    tree.saveFile("saveData.tree")
 
+    header, columns = treeio.loadColumns("saveData.tree")
+    print header["attList"]
+    print columns["id"]
+    pp = Control("control.txt")
+    print pp.parms
@@ -0,0 +1,280 @@
+#! /usr/bin/env python2.6
+
+""" A spatial hash over point positions, for neighbour queries while a tree grows.
+
+Space is cut into cubic cells of cellSize. Each point gets the integer key of its cell, and
+the index keeps every point sorted by that key, so the points of a cell are one contiguous
+slice. While the box around the points is not too sparse, a dense table holds the slice of
+every cell in it; otherwise slices are found with searchsorted. Inserts only append to a
+pending buffer; the buffer is sorted and merged into the index (searchsorted positions and
+one np.insert) the next time a query needs it, so adding a generation costs O(new points)
+and a merge O(N + new log new).
+
+Queries are batched: the query points look up all their neighbouring cells at once, the cell
+slices are expanded into candidate lists with repeat/cumsum, and the candidates are checked
+with one distance computation. A query only touches the cells around it, so the cost of a
+batch is about linear in the number of query points for a roughly even point density.
+Results come back in CSR form like treetopo: the hits of query q are ids[offsets[q]:offsets[q + 1]].
+"""
+
+import math
+
+import numpy as np
+
+_BITS = 21
+_MASK = (1 << _BITS) - 1
+_HALF = 1 << (_BITS - 1)
+
+# queries per batch; a batch holds every candidate point of its queries at once
+BLOCK = 4096
+# cells looked up at once
+CELLS = 1 << 18
+# largest box of cells, beyond one per point, that gets a dense lookup table
+TABLE_CELLS = 1 << 22
+
+
+def cellKeys(cells):
+    """ packs (N,3) integer cell coordinates into one int64 key each. Coordinates wrap at 2**21
+        cells, so cells 2**21 apart share a key. A searchsorted lookup then only gets extra
+        candidates, which the distance test drops; the dense table is not built when the
+        indexed cells could wrap (see SpatialHash._makeTable)."""
+    cells = np.asarray(cells, dtype=np.int64)
+    return (cells[:, 0] & _MASK) | ((cells[:, 1] & _MASK) << _BITS) | ((cells[:, 2] & _MASK) << (2 * _BITS))
+
+
+def _cubeOffsets(ring):
+    """ every (dx, dy, dz) with components in [-ring, ring] """
+    r = np.arange(-ring, ring + 1)
+    return np.stack(np.meshgrid(r, r, r, indexing="ij"), -1).reshape(-1, 3)
+
+
+class SpatialHash(object):
+    """ uniform grid over 3d points, addressed by hashed cell keys. Points carry an integer id,
+        which defaults to the order they were inserted in (the row number of a PointStore). """
+
+    def __init__(self, cellSize=1.0):
+        if cellSize <= 0:
+            raise ValueError("cellSize must be positive")
+        self.cellSize = float(cellSize)
+        self.count = 0
+        self.keys = np.empty(0, dtype=np.int64)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.pos = np.empty((0, 3), dtype=np.float64)
+        self.lo = None
+        self.hi = None
+        self._pending = []
+        self._table = None
+
+    def __len__(self):
+        return self.count
+
+    def cells(self, positions):
+        """ the integer cell coordinates of (N,3) positions """
+        return np.floor(np.asarray(positions, dtype=np.float64) / self.cellSize).astype(np.int64)
+
+    def insert(self, positions, ids=None):
+        """ adds (N,3) positions, with ids or numbered on from the last insert. The points are
+            only merged into the sorted index when a query needs them. """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        if ids is None:
+            ids = np.arange(self.count, self.count + len(positions))
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) != len(positions):
+            raise ValueError("%d ids for %d positions" % (len(ids), len(positions)))
+        if not len(positions):
+            return
+        cells = self.cells(positions)
+        lo, hi = cells.min(0), cells.max(0)
+        self.lo = lo if self.lo is None else np.minimum(self.lo, lo)
+        self.hi = hi if self.hi is None else np.maximum(self.hi, hi)
+        self._pending.append((cellKeys(cells), ids, positions.copy()))
+        self.count += len(positions)
+
+    def flush(self):
+        """ merges the pending points into the sorted index """
+        if not self._pending:
+            return
+        keys = np.concatenate([p[0] for p in self._pending])
+        ids = np.concatenate([p[1] for p in self._pending])
+        pos = np.concatenate([p[2] for p in self._pending])
+        self._pending = []
+        order = np.argsort(keys, kind="mergesort")
+        keys, ids, pos = keys[order], ids[order], pos[order]
+        where = np.searchsorted(self.keys, keys, side="right")
+        self.keys = np.insert(self.keys, where, keys)
+        self.ids = np.insert(self.ids, where, ids)
+        self.pos = np.insert(self.pos, where, pos, axis=0)
+        self._makeTable()
+
+    def _makeTable(self):
+        """ when the box of indexed cells is small enough, a dense table of the first slot and
+            point count of every cell in it, so looking a cell up is a plain gather """
+        self._table = None
+        dims = self.hi - self.lo + 1
+        # outside +-2**20 cells, or across 2**21 of them, keys wrap and one run of equal keys
+        # may hold the points of several cells
+        if np.any(self.lo < -_HALF) or np.any(self.hi >= _HALF) or np.any(dims >= 1 << _BITS):
+            return
+        if np.prod(dims.astype(np.float64)) > TABLE_CELLS + 4 * self.count:
+            return
+        change = np.flatnonzero(np.diff(self.keys)) + 1
+        first = np.concatenate(([0], change))
+        counts = np.diff(np.concatenate((first, [len(self.keys)])))
+        cells = self.cells(self.pos[first])
+        strides = np.array([dims[1] * dims[2], dims[2], 1], dtype=np.int64)
+        cell = ((cells - self.lo) * strides).sum(1)
+        starts = np.zeros(int(np.prod(dims)), dtype=np.int64)
+        sizes = np.zeros(int(np.prod(dims)), dtype=np.int64)
+        starts[cell] = first
+        sizes[cell] = counts
+        self._table = (starts, sizes, strides)
+
+    def _cellSlices(self, cells):
+        """ (first slot, point count) of each of the (M,3) cells in the sorted arrays """
+        if self._table is not None:
+            starts, sizes, strides = self._table
+            c = cells - self.lo
+            inside = np.all((c >= 0) & (c <= self.hi - self.lo), 1)
+            cell = (c * strides).sum(1)
+            cell[~inside] = 0
+            return starts[cell], np.where(inside, sizes[cell], 0)
+        keys = cellKeys(cells)
+        lo = np.searchsorted(self.keys, keys, side="left")
+        hi = np.searchsorted(self.keys, keys, side="right")
+        return lo, hi - lo
+
+    def _candidates(self, cells, offsets):
+        """ (query, slot) pairs for every indexed point in the cells at offsets around each
+            query's cell. Slots index the sorted arrays. """
+        nq = len(cells)
+        starts = [np.zeros(0, dtype=np.int64)]
+        counts = [np.zeros(0, dtype=np.int64)]
+        # every (query, offset) cell at once, query major so each query's candidates come out
+        # together, a few thousand queries at a time to bound the memory
+        step = max(1, CELLS // len(offsets))
+        for i in xrange(0, nq, step):
+            around = (cells[i:i + step, None, :] + offsets[None, :, :]).reshape(-1, 3)
+            first, count = self._cellSlices(around)
+            starts.append(first)
+            counts.append(count)
+        starts = np.concatenate(starts)
+        counts = np.concatenate(counts)
+        total = counts.sum()
+        query = np.repeat(np.repeat(np.arange(nq), len(offsets)), counts)
+        first = np.cumsum(counts) - counts
+        slots = np.repeat(starts - first, counts) + np.arange(total)
+        return query, slots
+
+    def radius(self, positions, radius, block=BLOCK):
+        """ finds the indexed points within radius of each of the (Q,3) query positions. radius
+            is one value or one per query. Returns (ids, offsets, distances) with the hits of
+            query q, in index order, at offsets[q]:offsets[q + 1]. Queries are run block at a
+            time to bound the candidate arrays. """
+        self.flush()
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        nq = len(positions)
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), (nq,))
+        offsets = np.zeros(nq + 1, dtype=np.int64)
+        if not nq or not self.count:
+            return np.empty(0, dtype=np.int64), offsets, np.empty(0)
+        ring = int(math.ceil(radius.max() / self.cellSize))
+        around = _cubeOffsets(ring)
+        cells = self.cells(positions)
+        hits = []
+        dists = []
+        for start in xrange(0, nq, block):
+            end = min(start + block, nq)
+            query, slots = self._candidates(cells[start:end], around)
+            query += start
+            dist = np.sqrt(((self.pos[slots] - positions[query]) ** 2).sum(1))
+            keep = dist <= radius[query]
+            hits.append(self.ids[slots[keep]])
+            dists.append(dist[keep])
+            offsets[start + 1:end + 1] = np.bincount(query[keep] - start, minlength=end - start)
+        np.cumsum(offsets, out=offsets)
+        return np.concatenate(hits), offsets, np.concatenate(dists)
+
+    def nearest(self, positions, k=1, maxDistance=None, block=BLOCK):
+        """ the k nearest indexed points to each of the (Q,3) query positions. Returns (ids,
+            distances), both (Q,k) and sorted by distance; when fewer than k points are indexed,
+            or within maxDistance, the missing entries are -1 and inf. Queries look at a growing
+            cube of cells, and are done once their k-th hit is nearer than the edge of the cube.
+            A maxDistance of a few cells keeps queries far from every point cheap. """
+        self.flush()
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        nq = len(positions)
+        ids = np.full((nq, k), -1, dtype=np.int64)
+        dists = np.full((nq, k), np.inf)
+        if not nq or not self.count or k < 1:
+            return ids, dists
+        cells = self.cells(positions)
+        for start in xrange(0, nq, block):
+            self._nearest(positions, cells, np.arange(start, min(start + block, nq)), ids, dists, maxDistance)
+        return ids, dists
+
+    def _nearest(self, positions, cells, todo, ids, dists, maxDistance=None):
+        """ fills the rows todo of the nearest() results """
+        k = ids.shape[1]
+        # the distance from each query to the faces of its own cell
+        inside = positions[todo] - cells[todo] * self.cellSize
+        margin = np.minimum(inside, self.cellSize - inside).min(1)
+        # how many cells each query is outside the box of indexed cells
+        gap = np.maximum(np.maximum(self.lo - cells[todo], cells[todo] - self.hi), 0).max(1)
+        ring = 0
+        last = None
+        if maxDistance is not None:
+            last = int(math.ceil(maxDistance / self.cellSize))
+        while len(todo):
+            if (2 * ring + 1) ** 3 > self.count:
+                # a cube with more cells than there are points, checking every point is cheaper
+                self._everyPoint(positions, todo, ids, dists, maxDistance)
+                return
+            # only queries whose cube reaches the box can find anything
+            look = np.flatnonzero(gap <= ring)
+            query, slots = self._candidates(cells[todo[look]], _cubeOffsets(ring))
+            query = look[query]
+            dist = np.sqrt(((self.pos[slots] - positions[todo[query]]) ** 2).sum(1))
+            # the cube of cells holds every point within reach of its query, and once it covers
+            # the whole index there is nothing more to find. Hits beyond reach may not be the
+            # nearest, so they are dropped and queries short of k hits look further out.
+            reach = margin + ring * self.cellSize
+            covers = np.all((cells[todo] - ring <= self.lo) & (cells[todo] + ring >= self.hi), 1)
+            if ring == last:
+                covers[:] = True
+            keep = (dist <= reach[query]) | covers[query]
+            if maxDistance is not None:
+                keep &= dist <= maxDistance
+            query, slots, dist = query[keep], slots[keep], dist[keep]
+            # sort by query, then distance (one float key sorts much faster than a lexsort),
+            # and keep the first k of each query
+            span = dist.max() + 1.0 if len(dist) else 1.0
+            order = np.argsort(query * span + dist)
+            query, slots, dist = query[order], slots[order], dist[order]
+            counts = np.bincount(query, minlength=len(todo))
+            first = np.cumsum(counts) - counts
+            rank = np.arange(len(query)) - np.repeat(first, counts)
+            top = rank < k
+            rows = todo[query[top]]
+            ids[rows, rank[top]] = self.ids[slots[top]]
+            dists[rows, rank[top]] = dist[top]
+            more = (counts < k) & ~covers
+            todo, margin, gap = todo[more], margin[more], gap[more]
+            ring = ring * 2 if ring else 1
+            if last is not None:
+                ring = min(ring, last)
+
+    def _everyPoint(self, positions, todo, ids, dists, maxDistance=None):
+        """ fills the rows todo of the nearest() results by measuring every indexed point """
+        k = min(ids.shape[1], self.count)
+        step = max(1, CELLS // self.count)
+        for i in xrange(0, len(todo), step):
+            rows = todo[i:i + step]
+            dist = np.sqrt(((positions[rows, None, :] - self.pos[None, :, :]) ** 2).sum(2))
+            slots = np.argsort(dist, 1)[:, :k]
+            dist = dist[np.arange(len(rows))[:, None], slots]
+            found = self.ids[slots]
+            if maxDistance is not None:
+                found[dist > maxDistance] = -1
+                dist[dist > maxDistance] = np.inf
+            ids[rows, :k] = found
+            dists[rows, :k] = dist
@@ -0,0 +1,67 @@
+#! /usr/bin/env python2.6
+
+""" Checks SpatialHash queries against a brute force search, near the origin and far from it,
+where the packed cell keys wrap. """
+
+import unittest
+
+import numpy as np
+
+import spatial
+
+
+def _bruteNearest(points, queries, k):
+    dist = np.sqrt(((queries[:, None, :] - points[None, :, :]) ** 2).sum(2))
+    order = np.argsort(dist, 1, kind="mergesort")[:, :k]
+    return np.sort(dist[np.arange(len(queries))[:, None], order], 1)
+
+
+def _bruteRadius(points, queries, radius):
+    dist = np.sqrt(((queries[:, None, :] - points[None, :, :]) ** 2).sum(2))
+    return [np.flatnonzero(row <= radius) for row in dist]
+
+
+class SpatialHashTest(unittest.TestCase):
+
+    def check(self, points, queries, cellSize, k=4, radius=None):
+        index = spatial.SpatialHash(cellSize)
+        index.insert(points)
+        ids, dists = index.nearest(queries, k)
+        self.assertTrue(np.allclose(dists, _bruteNearest(points, queries, k)))
+        # the ids found are at the distances found
+        found = np.sqrt(((points[ids] - queries[:, None, :]) ** 2).sum(2))
+        self.assertTrue(np.allclose(found, dists))
+        if radius is not None:
+            hits, offsets, dist = index.radius(queries, radius)
+            for q, expect in enumerate(_bruteRadius(points, queries, radius)):
+                self.assertEqual(sorted(hits[offsets[q]:offsets[q + 1]]), list(expect))
+        return index
+
+    def testNearOrigin(self):
+        rng = np.random.RandomState(1)
+        points = rng.rand(2000, 3) * 10 - 5
+        index = self.check(points, rng.rand(50, 3) * 12 - 6, 0.5, radius=0.7)
+        self.assertTrue(index._table is not None)
+
+    def testFarFromOrigin(self):
+        # 3e6 cells out, beyond where keys wrap
+        rng = np.random.RandomState(2)
+        points = rng.rand(1000, 3) * 10 + 3e6
+        index = self.check(points, points[:10] + 0.1, 1.0, radius=1.5)
+        self.assertTrue(index._table is None)
+
+    def testFarNegative(self):
+        rng = np.random.RandomState(3)
+        points = rng.rand(1000, 3) * 2 - 1500.0
+        self.check(points, rng.rand(20, 3) * 2 - 1500.0, 1e-3, k=2)
+
+    def testWiderThanWrap(self):
+        # the box spans more than 2**21 cells, so cells far apart share keys
+        rng = np.random.RandomState(4)
+        points = np.concatenate((rng.rand(300, 3), rng.rand(300, 3) + (1 << 21)))
+        index = self.check(points, np.concatenate((points[:5], points[-5:])) + 0.01, 1.0, radius=0.5)
+        self.assertTrue(index._table is None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,283 @@
+#! /usr/bin/env python2.6
+
+""" An on-disk cache of grown trees, addressed by what they were grown from.
+
+A tree is fully determined by its Control values and the growth code, so the cache key is a
+sha1 of the canonical json of the Control values and CODE_VERSION, a hash of the source of
+the modules growth runs through. Any edit to them starts a fresh set of keys. Exported .geo
+and .bgeo files are cached too, keyed also by the attribute schema they were written with.
+
+Entries are plain files in one directory, written to a temporary name and renamed into
+place so a reader never sees half an entry. Every hit touches the file, and when the
+directory grows past maxBytes the least recently used entries are removed. Each cache
+counts its own hits and misses, and appends one line per lookup to stats.log in the
+directory, so stats() can add up the lookups of every process that shared it. Once the log
+passes LOG_BYTES it is folded into the totals in stats.json, so it stays small. Both files
+count towards maxBytes.
+
+The directory is given to TreeCache or set in $MAKETREE_CACHE. Run as a script, the tree
+of control.txt is taken from the cache into saveData.tree.
+
+    cache = treecache.TreeCache("/tmp/trees")
+    tree = cache.tree(runtree.Control("control.txt"))
+    cache.geo(control, "tree.bgeo")
+"""
+
+import os
+import json
+import errno
+import time
+import shutil
+import hashlib
+import tempfile
+
+import runtree
+import treegeo
+
+# the modules whose code decides the points of a tree
+_GROWTH_MODULES = ("runtree", "treerand", "treemath", "pointstore", "treeio", "treegeo", "hgeo", "hgeobase",
+                   "HOU_AttributeClass", "HOU_Details_Class", "bjson", "geostream", "treetopo")
+
+DEFAULT_DIR = os.environ.get("MAKETREE_CACHE")
+DEFAULT_SIZE = 2 << 30
+STATS = "stats.log"
+TOTALS = "stats.json"
+LOG_BYTES = 1 << 16
+# held while stats.log is folded into stats.json; one older than this was left by a crash
+_FOLD_LOCK = ".stats.lock"
+_STALE = 60.0
+
+
+def _codeVersion():
+    digest = hashlib.sha1()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in _GROWTH_MODULES:
+        with open(os.path.join(here, name + ".py"), "rb") as fp:
+            digest.update(fp.read())
+    return digest.hexdigest()
+
+CODE_VERSION = _codeVersion()
+
+
+def controlKey(control, *extra):
+    """ the cache key of a Control (or a dict of its values), plus any extra strings """
+    values = control if isinstance(control, dict) else control.values()
+    canonical = {}
+    for name, kind in runtree.PARMS:
+        canonical[name] = kind(values[name])
+    text = json.dumps([CODE_VERSION, canonical] + list(extra), sort_keys=True)
+    return hashlib.sha1(text).hexdigest()
+
+
+class TreeCache(object):
+    """ least recently used cache of tree files in dirname, holding at most maxBytes """
+
+    def __init__(self, dirname=DEFAULT_DIR, maxBytes=DEFAULT_SIZE):
+        if not dirname:
+            raise ValueError("no cache directory: pass one to TreeCache or set $MAKETREE_CACHE")
+        self.dirname = dirname
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError as e:
+                # another process may have made it first
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def path(self, key, ext):
+        return os.path.join(self.dirname, key + ext)
+
+    def lookup(self, key, ext):
+        """ returns the file of an entry, marked as just used, or None. Counts a hit or a miss. """
+        filename = self.path(key, ext)
+        try:
+            os.utime(filename, None)
+        except OSError:
+            self.misses += 1
+            self._count("miss")
+            return None
+        self.hits += 1
+        self._count("hit")
+        return filename
+
+    def store(self, key, ext, write):
+        """ makes an entry by calling write(filename) on a temporary file, moves it into place
+            and evicts old entries to stay within maxBytes. Returns the entry's file. """
+        fd, temp = tempfile.mkstemp(ext, ".tmp", self.dirname)
+        os.close(fd)
+        try:
+            write(temp)
+            os.rename(temp, self.path(key, ext))
+        except Exception:
+            os.remove(temp)
+            raise
+        self.evict(keep=self.path(key, ext))
+        return self.path(key, ext)
+
+    def entries(self):
+        """ (last use, size, filename) of every entry, oldest first """
+        out = []
+        for name in os.listdir(self.dirname):
+            if name.startswith(".") or name in (STATS, TOTALS):
+                continue
+            filename = os.path.join(self.dirname, name)
+            try:
+                info = os.stat(filename)
+            except OSError:
+                continue
+            out.append((info.st_mtime, info.st_size, filename))
+        return sorted(out)
+
+    def evict(self, keep=None):
+        """ removes the least recently used entries, other than keep, until the cache fits in maxBytes """
+        entries = self.entries()
+        total = sum(e[1] for e in entries) + self._statsBytes()
+        for used, size, filename in entries:
+            if total <= self.maxBytes:
+                break
+            if filename == keep:
+                continue
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for used, size, filename in self.entries():
+            os.remove(filename)
+
+    def stats(self):
+        """ the hits and misses counted in this directory by every TreeCache, plus entry count and
+            size, the size including the stats files """
+        stats = self._totals()
+        hits, misses = _logCounts(os.path.join(self.dirname, STATS))
+        stats["hits"] += hits
+        stats["misses"] += misses
+        entries = self.entries()
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum(e[1] for e in entries) + self._statsBytes()
+        return stats
+
+    def _statsBytes(self):
+        total = 0
+        for name in (STATS, TOTALS):
+            try:
+                total += os.path.getsize(os.path.join(self.dirname, name))
+            except OSError:
+                pass
+        return total
+
+    def _totals(self):
+        try:
+            with open(os.path.join(self.dirname, TOTALS)) as fp:
+                totals = json.load(fp)
+            return {"hits": int(totals["hits"]), "misses": int(totals["misses"])}
+        except (IOError, ValueError, KeyError):
+            return {"hits": 0, "misses": 0}
+
+    def _count(self, event):
+        # one short write in append mode lands whole at the end, whichever process makes it
+        fd = os.open(os.path.join(self.dirname, STATS), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, event + "\n")
+            full = os.fstat(fd).st_size > LOG_BYTES
+        finally:
+            os.close(fd)
+        if full:
+            self._fold()
+
+    def _fold(self):
+        """ moves the counts of stats.log into stats.json. One process folds at a time; the others
+            leave it to that one and carry on logging to a fresh stats.log. """
+        lock = os.path.join(self.dirname, _FOLD_LOCK)
+        try:
+            os.close(os.open(lock, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            try:
+                if time.time() - os.path.getmtime(lock) > _STALE:
+                    os.remove(lock)
+            except OSError:
+                pass
+            return
+        try:
+            # the log is renamed away first, so new lookups start a new log. A lookup written
+            # by a process that opened the old log just before the rename can be missed.
+            folding = os.path.join(self.dirname, ".stats.folding")
+            try:
+                os.rename(os.path.join(self.dirname, STATS), folding)
+            except OSError:
+                return
+            hits, misses = _logCounts(folding)
+            totals = self._totals()
+            fd, temp = tempfile.mkstemp(".json", ".tmp", self.dirname)
+            with os.fdopen(fd, "w") as fp:
+                json.dump({"hits": totals["hits"] + hits, "misses": totals["misses"] + misses}, fp)
+            os.rename(temp, os.path.join(self.dirname, TOTALS))
+            os.remove(folding)
+        finally:
+            os.remove(lock)
+
+    def treeFile(self, control):
+        """ the cached column file (see Tree.saveFile) of the tree control grows, growing it on a miss """
+        key = controlKey(control)
+        filename = self.lookup(key, ".tree")
+        if filename is None:
+            tree = _grow(control)
+            filename = self.store(key, ".tree", tree.saveFile)
+        return filename
+
+    def tree(self, control):
+        """ the Tree control grows, loaded from the cache or grown and stored """
+        tree = runtree.Tree()
+        tree.loadFile(self.treeFile(control))
+        return tree
+
+    def geo(self, control, filename, schemaFile="control.txt"):
+        """ writes the .geo (or .bgeo, by extension) of the tree control grows to filename, copied
+            from the cache or made from the cached tree and stored """
+        ext = ".bgeo" if filename.endswith(".bgeo") else ".geo"
+        with open(schemaFile, "rb") as fp:
+            schema = hashlib.sha1(fp.read()).hexdigest()
+        key = controlKey(control, ext, schema)
+        cached = self.lookup(key, ext)
+        if cached is None:
+            tree = self.tree(control)
+            cached = self.store(key, ext, lambda temp: treegeo.saveTreeGeo(tree, temp, schemaFile))
+        shutil.copyfile(cached, filename)
+        return filename
+
+
+def _logCounts(filename):
+    """ (hits, misses) logged in a stats.log """
+    hits = misses = 0
+    try:
+        with open(filename) as fp:
+            for line in fp:
+                if line == "hit\n":
+                    hits += 1
+                elif line == "miss\n":
+                    misses += 1
+    except IOError:
+        pass
+    return hits, misses
+
+
+def _grow(control):
+    values = control if isinstance(control, dict) else control.values()
+    tree = runtree.Tree()
+    tree.makeTree(control=runtree.Control(None, **values))
+    return tree
+
+
+if __name__ == "__main__":
+    # an unchanged control.txt is not grown again
+    cache = TreeCache(DEFAULT_DIR or "treecache")
+    shutil.copyfile(cache.treeFile(runtree.Control("control.txt")), "saveData.tree")
+    print "cache %s: hits %d, misses %d" % (cache.dirname, cache.hits, cache.misses)
+    print "all lookups: hits %(hits)d, misses %(misses)d, %(entries)d entries, %(bytes)d bytes" % cache.stats()
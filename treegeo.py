@@ -0,0 +1,110 @@
+#! /usr/bin/env python2.6
+
+""" Writes a grown tree straight to a Houdini JSON .geo file.
+
+The point attributes to export are the ones defined after "start att def" in control.txt.
+Each definition names the Houdini attribute and gives the index of the tree attribute it
+comes from (its place in Tree.attList), so "P" is filled from "pos". Each unbranched run of
+parent to child links becomes one open Poly primitive (see treetopo), and they are written
+together as one primitive run.
+"""
+
+import json
+
+import numpy as np
+
+import hgeo
+import runtree
+import treetopo
+
+SCHEMA_FIELDS = ["name", "index", "type", "scope", "options", "size", "defaults", "strings", "storage"]
+
+
+def _fieldValue(line):
+    """ the value part of a schema line, which is everything before its # comment """
+    return line.split("#", 1)[0].strip()
+
+
+def readSchema(filename="control.txt"):
+    """ reads the attribute definitions of a control file. Returns a list of dicts, one per
+        attribute, with the keys in SCHEMA_FIELDS."""
+    values = []
+    with open(filename) as f:
+        start = 0
+        for line in f:
+            if "start att def" in line:
+                start = 1
+                continue
+            if start == 1:
+                value = _fieldValue(line)
+                if value:
+                    values.append(value)
+    schema = []
+    for i in range(0, len(values) - len(SCHEMA_FIELDS) + 1, len(SCHEMA_FIELDS)):
+        att = dict(zip(SCHEMA_FIELDS, values[i:i + len(SCHEMA_FIELDS)]))
+        att["name"] = att["name"].strip('"')
+        att["index"] = int(att["index"])
+        att["size"] = int(att["size"])
+        att["options"] = json.loads(att["options"]) if att["options"] != '""' else {}
+        att["defaults"] = json.loads(att["defaults"]) if att["defaults"] != '""' else None
+        att["strings"] = json.loads(att["strings"]) if att["strings"] != '""' else None
+        schema.append(att)
+    return schema
+
+
+def _columns(source):
+    """ returns (dict of point columns, attList) for a Tree, a PointStore or a dict of columns """
+    if isinstance(source, runtree.Tree):
+        return source.points.columns(), source.attList
+    if hasattr(source, "columns"):
+        return source.columns(), source.index
+    return source, dict((s[0], i) for i, s in enumerate(runtree.POINT_SCHEMA))
+
+
+def treeDetail(source, schema=None):
+    """ builds an hgeo.Detail from a Tree, its PointStore or a dict of point columns (as loaded by
+        treeio.loadColumns). schema is a readSchema list, read from control.txt when not given."""
+    if schema is None:
+        schema = readSchema("control.txt")
+    cols, attList = _columns(source)
+    names = dict((index, name) for name, index in attList.items())
+    detail = hgeo.Detail()
+    for att in schema:
+        col = np.asarray(cols[names[att["index"]]])
+        width = 1 if col.ndim == 1 else col.shape[1]
+        if att["options"].get("type", {}).get("value") == "hpoint" and width == 3:
+            col = np.column_stack((col, np.ones(len(col))))
+            width = 4
+        if width != att["size"]:
+            raise ValueError("%s has %d components, the schema says %d" % (att["name"], width, att["size"]))
+        a = hgeo.Attribute(att["name"], att["type"], att["scope"])
+        a.Options = att["options"]
+        a.TupleSize = att["size"]
+        a.Defaults = att["defaults"]
+        a.Strings = att["strings"]
+        a.Storage = att["storage"]
+        a.Array = col
+        detail.PointAttributes[a.Name] = a
+
+    # one open polygon per unbranched run of links, all in one run
+    parents = np.asarray(cols["parentId"]).astype(np.int64)
+    vertexMap, offsets = treetopo.branchChains(parents)
+    detail.VertexMap = vertexMap
+    detail.Primitives = [hgeo.PolyRun(np.arange(len(vertexMap)), offsets, False)]
+    return detail
+
+
+def saveTreeGeo(source, filename, schemaFile="control.txt", indent=None, pagesize=hgeo.PAGESIZE):
+    """ writes a Tree (or its point columns) to a Houdini .geo file, or binary .bgeo by extension.
+        Attributes are written as paged data unless pagesize is None, so attributes which hold
+        one value over long runs (alive, split, angle) take one value per page."""
+    detail = treeDetail(source, readSchema(schemaFile))
+    binary = filename.endswith(".bgeo")
+    with open(filename, "wb" if binary else "w") as fp:
+        detail.save(fp, indent=indent, binary=binary, pagesize=pagesize)
+
+
+if __name__ == "__main__":
+    tree = runtree.Tree()
+    tree.makeTree()
+    saveTreeGeo(tree, "tree.geo")
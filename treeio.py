@@ -0,0 +1,290 @@
+#! /usr/bin/env python2.6
+
+""" Reading and writing tree point data.
+
+Trees are saved in a small binary columnar container:
+
+    8 bytes   magic "MKTREE\\0\\0"
+    4 bytes   format version, uint32 little-endian
+    4 bytes   header length in bytes, uint32 little-endian
+    header    json: point count, one entry per column (name, dtype, width, offset, nbytes),
+              the Control values and any extra fields the writer adds
+    columns   each column one contiguous little-endian buffer, starting on a 64 byte boundary
+
+Each column is written and read with a single call. The old cPickle [attList, allPoints]
+files can be turned into columns with pickleToColumns/convertPickle.
+
+GenerationSink is an append-only sink for streamed growth (Tree.streamTree). It is a
+directory with one raw file per point column, plus a small json header written on close.
+Columns are appended independently, but each one always receives its rows in id order.
+ColumnSpool holds rows on disk the same way, for data that is read back once, in order,
+a chunk at a time (the growth front of streamTree).
+"""
+
+import os
+import json
+import struct
+import tempfile
+import cPickle as pickle
+
+import numpy as np
+
+MAGIC = "MKTREE\0\0"
+VERSION = 1
+ALIGN = 64
+
+SINK_VERSION = 1
+SINK_HEADER = "header.json"
+
+
+class GenerationSink(object):
+    """ append-only column files in dirname. schema is a list of (name, dtype, width, default)
+        like runtree.POINT_SCHEMA. Use close(), or a with statement, to write the header."""
+
+    def __init__(self, dirname, schema, control=None):
+        self.dirname = dirname
+        self.schema = [(s[0], np.dtype(s[1]).str, s[2]) for s in schema]
+        self.control = control
+        self.counts = {}
+        self.dtypes = {}
+        self.files = {}
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        for name, dtype, width in self.schema:
+            self.counts[name] = 0
+            self.dtypes[name] = np.dtype(dtype)
+            self.files[name] = open(os.path.join(dirname, name + ".raw"), "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, cols):
+        """ appends rows to some or all of the columns, given as a dict of arrays """
+        for name, values in cols.items():
+            np.ascontiguousarray(values, dtype=self.dtypes[name]).tofile(self.files[name])
+            self.counts[name] += len(values)
+
+    def close(self):
+        """ closes the column files and writes the header. All columns must hold the same number of rows """
+        if not self.files:
+            return
+        for fp in self.files.values():
+            fp.close()
+        self.files = {}
+        counts = set(self.counts.values())
+        if len(counts) > 1:
+            raise ValueError("sink columns have different lengths: %s" % self.counts)
+        header = {
+            "version": SINK_VERSION,
+            "count": counts.pop() if counts else 0,
+            "columns": self.schema,
+            "control": self.control.values() if self.control is not None else None,
+            }
+        with open(os.path.join(self.dirname, SINK_HEADER), "w") as fp:
+            json.dump(header, fp)
+
+
+class ColumnSpool(object):
+    """ rows of some columns kept in temporary files, to be read back in order a chunk at a time.
+        schema is a list of (name, dtype, width, ...) like runtree.POINT_SCHEMA. """
+
+    def __init__(self, schema):
+        self.schema = [(s[0], np.dtype(s[1]), s[2]) for s in schema]
+        self.files = dict((s[0], tempfile.TemporaryFile()) for s in self.schema)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def write(self, cols):
+        """ appends rows to every column, given as a dict of arrays """
+        for name, dtype, width in self.schema:
+            np.ascontiguousarray(cols[name], dtype=dtype).tofile(self.files[name])
+        self.count += len(cols[self.schema[0][0]])
+
+    def chunks(self, rows):
+        """ yields the rows written so far as dicts of columns, at most rows at a time, then closes the spool """
+        for fp in self.files.values():
+            fp.flush()
+            fp.seek(0)
+        for start in xrange(0, self.count, rows):
+            num = min(rows, self.count - start)
+            chunk = {}
+            for name, dtype, width in self.schema:
+                values = np.fromfile(self.files[name], dtype=dtype, count=num * width)
+                chunk[name] = values if width == 1 else values.reshape(num, width)
+            yield chunk
+        self.close()
+
+    def close(self):
+        for fp in self.files.values():
+            fp.close()
+        self.files = {}
+
+
+def readSink(dirname, mmap=False):
+    """ loads a closed GenerationSink, returns (header, dict of columns). With mmap the columns are
+        read-only memory maps of the column files, as in loadColumns."""
+    with open(os.path.join(dirname, SINK_HEADER)) as fp:
+        header = json.load(fp)
+    cols = {}
+    for name, dtype, width in header["columns"]:
+        filename = os.path.join(dirname, name + ".raw")
+        dtype = np.dtype(dtype)
+        if mmap:
+            nbytes = header["count"] * width * dtype.itemsize
+            cols[name] = _mapColumn(filename, dtype, 0, nbytes, width)
+            continue
+        col = np.fromfile(filename, dtype=dtype)
+        if width != 1:
+            col = col.reshape(-1, width)
+        cols[name] = col
+    return header, cols
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def saveColumns(filename, cols, schema=None, control=None, extra=None):
+    """ writes a dict of columns to filename in the container format. schema gives the
+        column order and dtypes, (name, dtype, width, ...) like runtree.POINT_SCHEMA; without
+        it every column is written as it is, in name order. control is a runtree.Control whose
+        values go in the header, extra a dict of more header fields."""
+    if schema is None:
+        schema = [(name, cols[name].dtype, 1 if cols[name].ndim == 1 else cols[name].shape[1])
+                  for name in sorted(cols)]
+    arrays = []
+    entries = []
+    count = None
+    for s in schema:
+        name, width = s[0], s[2]
+        dtype = np.dtype(s[1]).newbyteorder("<")
+        col = np.ascontiguousarray(cols[name], dtype=dtype)
+        if count is None:
+            count = len(col)
+        elif len(col) != count:
+            raise ValueError("column %s has %d rows, expected %d" % (name, len(col), count))
+        arrays.append(col)
+        entries.append({"name": name, "dtype": dtype.str, "width": width, "nbytes": col.nbytes})
+    header = {
+        "version": VERSION,
+        "count": count or 0,
+        "columns": entries,
+        "control": control.values() if control is not None else None,
+        }
+    if extra:
+        header.update(extra)
+    # offsets depend on the header length, which depends on the offsets' digits, so
+    # reserve room for them first and pad the header out to its final size
+    for e in entries:
+        e["offset"] = 0
+    size = len(json.dumps(header, sort_keys=True)) + 20 * len(entries) + 16
+    offset = _aligned(16 + size)
+    for e in entries:
+        e["offset"] = offset
+        offset = _aligned(offset + e["nbytes"])
+    text = json.dumps(header, sort_keys=True)
+    text += " " * (size - len(text))
+    with open(filename, "wb") as fp:
+        fp.write(MAGIC + struct.pack("<II", VERSION, len(text)) + text)
+        for e, col in zip(entries, arrays):
+            fp.seek(e["offset"])
+            col.tofile(fp)
+
+
+def isColumnFile(filename):
+    """ True when filename starts with the container magic """
+    with open(filename, "rb") as fp:
+        return fp.read(len(MAGIC)) == MAGIC
+
+
+def readHeader(fp):
+    """ reads and checks the container header from an open file """
+    magic = fp.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError("not a tree column file")
+    version, length = struct.unpack("<II", fp.read(8))
+    if version > VERSION:
+        raise ValueError("tree column file version %d is newer than this reader (%d)" % (version, VERSION))
+    return json.loads(fp.read(length))
+
+
+def _shape(entry, col):
+    if entry["width"] != 1:
+        col = col.reshape(-1, entry["width"])
+    return col
+
+
+def _mapColumn(filename, dtype, offset, nbytes, width):
+    """ read-only memory map of one column; pages are only read when they are touched """
+    count = nbytes // dtype.itemsize
+    shape = (count,) if width == 1 else (count // width, width)
+    if count == 0:
+        # mmap can't map zero bytes
+        col = np.empty(shape, dtype=dtype)
+        col.flags.writeable = False
+        return col
+    return np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def loadColumns(filename, names=None, mmap=False):
+    """ reads a container file, returns (header, dict of columns). names limits the columns read.
+        With mmap the columns are read-only views of the file that page in on demand, so opening
+        is quick whatever the size and processes mapping the same file share its pages."""
+    cols = {}
+    with open(filename, "rb") as fp:
+        header = readHeader(fp)
+        for e in header["columns"]:
+            if names is not None and e["name"] not in names:
+                continue
+            dtype = np.dtype(e["dtype"])
+            if mmap:
+                cols[e["name"]] = _mapColumn(filename, dtype, e["offset"], e["nbytes"], e["width"])
+                continue
+            fp.seek(e["offset"])
+            cols[e["name"]] = _shape(e, np.fromfile(fp, dtype=dtype, count=e["nbytes"] // dtype.itemsize))
+    return header, cols
+
+
+def pickleToColumns(data):
+    """ turns the old pickled [attList, allPoints] list into a dict of columns """
+    attList, allPoints = data
+    cols = {}
+    for name, index in attList.items():
+        values = [p[index] for p in allPoints]
+        if values and isinstance(values[0], (int, long)):
+            try:
+                col = np.array(values, dtype=np.int64)
+            except OverflowError:
+                # big unsigned values, i.e. the uint64 point keys
+                col = np.array(values, dtype=np.uint64)
+        else:
+            col = np.array(values)
+        cols[name] = col
+    return cols
+
+
+def convertPickle(src, dst, schema=None):
+    """ rewrites an old cPickle tree file (Tree.saveFile before the container format) as a container """
+    with open(src, "rb") as fp:
+        data = pickle.load(fp)
+    attList = data[0]
+    cols = pickleToColumns(data)
+    if schema is None:
+        order = sorted(attList, key=attList.get)
+        schema = [(name, cols[name].dtype, 1 if cols[name].ndim == 1 else cols[name].shape[1])
+                  for name in order]
+    saveColumns(dst, cols, schema)
+
+
+def packSink(dirname, filename):
+    """ packs a closed GenerationSink directory into a single container file """
+    header, cols = readSink(dirname)
+    extra = {}
+    if header.get("control"):
+        extra["control"] = header["control"]
+    saveColumns(filename, cols, header["columns"], extra=extra)
@@ -1,6 +1,16 @@
 import math, random
+import numpy as np
+
+def _isArray(*vecs):
+    """True when any argument is a numpy array, which sends the call to the batched kernels"""
+    for v in vecs:
+        if isinstance(v, np.ndarray):
+            return True
+    return False
 
 def clamp01(num):
+    if _isArray(num):
+        return batchClamp01(num)
     newNum = num - math.floor(num)
     return newNum
 
@@ -12,6 +22,8 @@ def getRand(seed):
 
 def vecSub(subThisVec,fromThisVec):
     """the first vector gets subtracted from the second vector"""
+    if _isArray(subThisVec,fromThisVec):
+        return batchSub(subThisVec,fromThisVec)
     ax = subThisVec[0]
     ay = subThisVec[1]
     az = subThisVec[2]
@@ -23,6 +35,8 @@ def vecSub(subThisVec,fromThisVec):
 
 def vecNorm(inVec):
     """ TESTED returns a normalized vector """
+    if _isArray(inVec):
+        return batchNorm(inVec)
     a = inVec[0]
     b = inVec[1]
     c = inVec[2]
@@ -34,6 +48,8 @@ def vecNorm(inVec):
     return vec
 
 def vecAdd(aVec,bVec):
+    if _isArray(aVec,bVec):
+        return batchAdd(aVec,bVec)
     ax = aVec[0]
     ay = aVec[1]
     az = aVec[2]
@@ -44,6 +60,8 @@ def vecAdd(aVec,bVec):
     return newVec
 
 def vecBlend(aVec,bVec,bias):
+    if _isArray(aVec,bVec,bias):
+        return batchBlend(aVec,bVec,bias)
     bias = clamp01(bias)
     ax = aVec[0]
     ay = aVec[1]
@@ -56,6 +74,8 @@ def vecBlend(aVec,bVec,bias):
     return newVec
 
 def vecMult(aVec,mult):
+    if _isArray(aVec,mult):
+        return batchMult(aVec,mult)
     ax = aVec[0]
     ay = aVec[1]
     az = aVec[2]
@@ -63,11 +83,113 @@ def vecMult(aVec,mult):
     return newVec
 
 def vecLength(vec):
+    if _isArray(vec):
+        return batchLength(vec)
     a = vec[0]
     b = vec[1]
     c = vec[2]
     length = math.sqrt((a*a)+(b*b)+(c*c))
     return length
+
+def vecDot(aVec,bVec):
+    return float(batchDot(_rows(aVec),_rows(bVec))[0])
+
+def vecCross(aVec,bVec):
+    return _tuple(batchCross(_rows(aVec),_rows(bVec)))
+
+def vecRotate(vec,axis,angle):
+    """rotates vec about axis by angle (radians)"""
+    return _tuple(batchRotate(_rows(vec),_rows(axis),angle))
+
+def vecSlerp(aVec,bVec,bias,maxAngle=None):
+    """turns aVec towards bVec by bias (0-1) of the angle between them, at most maxAngle radians"""
+    return _tuple(batchSlerp(_rows(aVec),_rows(bVec),bias,maxAngle))
+
+def _rows(vec):
+    return np.asarray(vec, dtype=np.float64).reshape(-1, 3)
+
+def _tuple(arr):
+    return tuple(arr[0].tolist())
+
+#---------------------------- batched (N,3) versions ----------------------------
+# Each takes (N,3) arrays (a single 3-vector broadcasts) and scalars or (N,) arrays,
+# and works on all rows at once.
+
+def _col(values):
+    """(N,) values as an (N,1) column so they broadcast against (N,3) rows"""
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    return values
+
+def batchClamp01(num):
+    num = np.asarray(num, dtype=np.float64)
+    return num - np.floor(num)
+
+def batchSub(subThisVec,fromThisVec):
+    """the first vectors get subtracted from the second vectors"""
+    return np.asarray(fromThisVec, dtype=np.float64) - np.asarray(subThisVec, dtype=np.float64)
+
+def batchAdd(aVec,bVec):
+    return np.asarray(aVec, dtype=np.float64) + np.asarray(bVec, dtype=np.float64)
+
+def batchMult(aVec,mult):
+    return np.asarray(aVec, dtype=np.float64) * _col(mult)
+
+def batchLength(vec):
+    vec = np.asarray(vec, dtype=np.float64)
+    a = vec[..., 0]
+    b = vec[..., 1]
+    c = vec[..., 2]
+    return np.sqrt((a*a)+(b*b)+(c*c))
+
+def batchNorm(inVec):
+    return np.asarray(inVec, dtype=np.float64) / _col(batchLength(inVec))
+
+def batchBlend(aVec,bVec,bias):
+    bias = _col(batchClamp01(bias))
+    return np.asarray(aVec, dtype=np.float64)*bias + np.asarray(bVec, dtype=np.float64)*(1-bias)
+
+def batchDot(aVec,bVec):
+    aVec = np.asarray(aVec, dtype=np.float64)
+    bVec = np.asarray(bVec, dtype=np.float64)
+    return aVec[..., 0]*bVec[..., 0] + aVec[..., 1]*bVec[..., 1] + aVec[..., 2]*bVec[..., 2]
+
+def batchCross(aVec,bVec):
+    return np.cross(np.asarray(aVec, dtype=np.float64), np.asarray(bVec, dtype=np.float64))
+
+def batchRotate(vec,axis,angle):
+    """rotates each vec about its axis by angle radians (Rodrigues' formula)"""
+    vec = np.asarray(vec, dtype=np.float64)
+    axis = batchNorm(axis)
+    cos = _col(np.cos(angle))
+    sin = _col(np.sin(angle))
+    return vec*cos + batchCross(axis, vec)*sin + axis*_col(batchDot(axis, vec))*(1-cos)
+
+def batchSlerp(aVec,bVec,bias,maxAngle=None):
+    """turns each aVec towards its bVec by bias (0-1) of the angle between them, never by more than
+    maxAngle radians. Returns unit vectors. Where bVec points straight away from aVec any
+    perpendicular direction is used."""
+    a = batchNorm(aVec)
+    b = batchNorm(bVec)
+    a, b = np.broadcast_arrays(a, b)
+    cosAB = np.clip(batchDot(a, b), -1.0, 1.0)
+    angle = np.arccos(cosAB) * np.asarray(bias, dtype=np.float64)
+    if maxAngle is not None:
+        angle = np.minimum(angle, maxAngle)
+    perp = b - a*_col(cosAB)
+    perpLen = batchLength(perp)
+    flat = perpLen < 1e-12
+    if flat.any():
+        # parallel or opposite: pick a perpendicular off whichever axis is least aligned with a
+        fa = a[flat]
+        other = np.zeros_like(fa)
+        other[np.arange(len(fa)), np.argmin(np.abs(fa), axis=1)] = 1.0
+        perp = perp.copy()
+        perp[flat] = batchCross(fa, other)
+        perpLen = batchLength(perp)
+    perp = perp / _col(perpLen)
+    return a*_col(np.cos(angle)) + perp*_col(np.sin(angle))
     
 
 if __name__=="__main__":
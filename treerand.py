@@ -0,0 +1,81 @@
+#! /usr/bin/env python2.6
+
+""" Counter-based random numbers for tree growth.
+
+Instead of reseeding the Mersenne Twister for every point, each random number is a hash of
+(seed, point key, purpose, counter). Nothing is carried from one draw to the next, so a point
+gets the same numbers whether it is grown alone, in a batch, or in another process.
+
+Point keys come from the tree structure, not from point ids: the root has key 0 and each
+child key is a hash of its parent's key and its sibling number. Ids change when subtrees are
+grown separately and stitched together, keys do not.
+"""
+
+import numpy as np
+
+# purposes, so the different draws made for one point are independent
+PURPOSE_DIR = 1
+PURPOSE_STEP = 2
+PURPOSE_BRANCH = 3
+PURPOSE_ATTRACT = 4
+
+ROOT_KEY = 0
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_M2 = np.uint64(0x94D049BB133111EB)
+_S30 = np.uint64(30)
+_S27 = np.uint64(27)
+_S31 = np.uint64(31)
+_S11 = np.uint64(11)
+
+
+def mix64(x):
+    """ splitmix64 finalizer over a uint64 array. Wraps on overflow, returns a new array """
+    x = np.array(x, dtype=np.uint64)
+    x ^= x >> _S30
+    x *= _M1
+    x ^= x >> _S27
+    x *= _M2
+    x ^= x >> _S31
+    return x
+
+
+def childKeys(parentKeys, siblings):
+    """ returns the keys of children, given their parents' keys and their sibling numbers """
+    parentKeys = np.asarray(parentKeys, dtype=np.uint64)
+    siblings = np.asarray(siblings, dtype=np.uint64)
+    return mix64(parentKeys * _GOLDEN + siblings + np.uint64(1))
+
+
+class CounterRNG(object):
+    """ stateless random source keyed by a seed. All methods take an array of point keys
+        and return one row of numbers per key."""
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.key = mix64(np.array([seed], dtype=np.float64).view(np.uint64))[0]
+
+    def bits(self, keys, purpose, num=1):
+        """ returns an (N,num) uint64 array of random bits """
+        keys = np.asarray(keys, dtype=np.uint64).reshape(-1, 1)
+        counter = np.arange(num, dtype=np.uint64).reshape(1, -1)
+        x = mix64(keys ^ self.key)
+        x = mix64(x + mix64([purpose]))
+        return mix64(x + counter * _GOLDEN)
+
+    def uniform(self, keys, purpose, num=1):
+        """ returns an (N,num) float64 array in [0,1) """
+        return (self.bits(keys, purpose, num) >> _S11) * (1.0 / (1 << 53))
+
+    def unitVectors(self, keys, purpose=PURPOSE_DIR):
+        """ returns an (N,3) array of unit vectors spread evenly over the sphere """
+        u = self.uniform(keys, purpose, 2)
+        z = 2.0 * u[:, 0] - 1.0
+        phi = 2.0 * np.pi * u[:, 1]
+        r = np.sqrt(np.maximum(1.0 - z * z, 0.0))
+        return np.column_stack((r * np.cos(phi), z, r * np.sin(phi)))
+
+
+if __name__=="__main__":
+    print "You ran this module directly instead of importing it"
@@ -0,0 +1,74 @@
+#! /usr/bin/env python2.6
+
+""" Turns the parentId links of a tree into branch polylines.
+
+Every parent to child link is an edge. A chain is a run of edges through points that have
+exactly one child, so it becomes one open polyline from a branching point (or the root) to
+the next branching point or tip. Branching points start a chain for each of their children,
+so they are shared as a vertex by the chain ending there and the chains leaving it.
+
+Everything works on whole arrays: the child adjacency comes from a bincount and a stable
+argsort of the parent ids, the chains are walked one step at a time for all of them at once,
+and each vertex is scattered straight to its place in the output. The work is linear in the
+number of points, and the number of numpy passes is the length of the longest chain (at
+most the number of growth steps for a grown tree).
+
+Point ids are row numbers, as they are in a PointStore. A root is its own parent.
+"""
+
+import numpy as np
+
+
+def childAdjacency(parents):
+    """ returns (children, starts) in CSR form: the children of point p are
+        children[starts[p]:starts[p + 1]], in point order """
+    parents = np.asarray(parents)
+    n = len(parents)
+    nodes = np.flatnonzero(parents != np.arange(n))
+    counts = np.bincount(parents[nodes], minlength=n)
+    starts = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=starts[1:])
+    children = nodes[np.argsort(parents[nodes], kind="mergesort")]
+    return children, starts
+
+
+def branchChains(parents):
+    """ compresses the tree into polylines. Returns (vertexMap, offsets): the point of every
+        vertex, chain after chain, and the CSR offsets of the chains, so chain i has the
+        vertices offsets[i]:offsets[i + 1]."""
+    parents = np.asarray(parents)
+    n = len(parents)
+    children, starts = childAdjacency(parents)
+    outdeg = np.diff(starts)
+    isRoot = parents == np.arange(n)
+
+    # the one child of every point that has a single child, where a chain carries on
+    only = np.full(n, -1, dtype=np.int64)
+    single = np.flatnonzero(outdeg == 1)
+    only[single] = children[starts[single]]
+
+    # a chain starts at each edge whose parent is a root or does not have exactly one child
+    edges = np.flatnonzero(~isRoot)
+    heads = edges[(outdeg[parents[edges]] != 1) | isRoot[parents[edges]]]
+
+    # walk all chains a step at a time, recording (chain, position, point)
+    chain = np.arange(len(heads))
+    levels = [(chain, 0, parents[heads])]
+    node = heads
+    level = 1
+    while len(node):
+        levels.append((chain, level, node))
+        carry = outdeg[node] == 1
+        chain = chain[carry]
+        node = only[node[carry]]
+        level += 1
+
+    lengths = np.zeros(len(heads), dtype=np.int64)
+    for chain, level, node in levels:
+        lengths[chain] += 1
+    offsets = np.zeros(len(heads) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    vertexMap = np.empty(offsets[-1], dtype=np.int64)
+    for chain, level, node in levels:
+        vertexMap[offsets[chain] + level] = node
+    return vertexMap, offsets